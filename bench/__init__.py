@@ -0,0 +1,46 @@
+"""Микробенчмарки бота: python -m bench.<модуль>
+
+Настройки читаются при импорте config.settings, поэтому значения по
+умолчанию для бенчмарков задаются здесь, до импорта модулей бота.
+"""
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict
+
+os.environ.setdefault('TELEGRAM_TOKEN', '42:BENCH')
+os.environ.setdefault('DATABASE_URL', 'sqlite+aiosqlite:///:memory:')
+os.environ.setdefault('FSM_STORAGE', 'memory')
+os.environ.setdefault('THROTTLE_BURST', '1000000')
+
+
+def quiet():
+    """Без логов aiogram о каждом апдейте (иначе замеряется логирование)"""
+    logging.disable(logging.INFO)
+
+
+async def per_call(call: Callable[[], Awaitable], number: int = 5000, repeat: int = 5) -> float:
+    """Среднее время вызова (сек.), лучшее из repeat прогонов"""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            await call()
+        best = min(best, (time.perf_counter() - started) / number)
+    return best
+
+
+async def compare(calls: Dict[str, Callable[[], Awaitable]], number: int = 5000, repeat: int = 5) -> Dict[str, float]:
+    """per_call для нескольких вариантов с чередованием прогонов (меньше влияет шум)"""
+    best = dict.fromkeys(calls, float('inf'))
+    for _ in range(repeat):
+        for name, call in calls.items():
+            best[name] = min(best[name], await per_call(call, number, repeat=1))
+    return best
+
+
+def report(name: str, seconds: float, baseline: float | None = None):
+    line = f"{name:<44}{seconds * 1e6:9.2f} мкс"
+    if baseline is not None:
+        line += f"  ({(seconds - baseline) * 1e6:+.2f} мкс)"
+    print(line)
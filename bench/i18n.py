@@ -0,0 +1,61 @@
+"""Накладные расходы i18n на апдейт: python -m bench.i18n
+
+Сравнивается прежний I18nMiddleware (словари на каждый экземпляр,
+новое замыкание t и str.format на каждый апдейт) с текущим общим
+каталогом: вызов middleware и одна подстановка в хендлере.
+"""
+import asyncio
+import json
+from typing import Any, Dict
+
+# Первым: настройки бота для бенчмарков
+from bench import compare, report
+from aiogram.types import User
+
+from middlewares.i18n import LOCALES_DIR, I18nMiddleware
+
+
+class LegacyI18nMiddleware:
+    """I18nMiddleware до общего каталога (для сравнения)"""
+
+    def __init__(self):
+        self.translations = {}
+        for lang in ('ru', 'en'):
+            with open(LOCALES_DIR / f'{lang}.json', 'r', encoding='utf-8') as f:
+                self.translations[lang] = json.load(f)
+
+    async def __call__(self, handler, event, data: Dict[str, Any]) -> Any:
+        user: User = data.get('event_from_user')
+        lang = 'ru'
+        if user and user.language_code:
+            if user.language_code.startswith('en'):
+                lang = 'en'
+
+        def t(key: str, **kwargs) -> str:
+            text = self.translations.get(lang, {}).get(key, key)
+            return text.format(**kwargs) if kwargs else text
+
+        data['t'] = t
+        data['lang'] = lang
+        return await handler(event, data)
+
+
+async def handler(event, data: Dict[str, Any]):
+    return data['t']('destination_saved', destination='Турция')
+
+
+async def main():
+    for language_code in ('ru', 'en-GB'):
+        user = User(id=12345, is_bot=False, first_name='Test', language_code=language_code)
+        legacy = LegacyI18nMiddleware()
+        current = I18nMiddleware()
+        result = await compare({
+            'legacy': lambda: legacy(handler, None, {'event_from_user': user}),
+            'catalog': lambda: current(handler, None, {'event_from_user': user}),
+        }, number=50000, repeat=10)
+        report(f'Прежний I18nMiddleware ({language_code})', result['legacy'])
+        report(f'Общий каталог ({language_code})', result['catalog'], result['legacy'])
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
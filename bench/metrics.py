@@ -0,0 +1,55 @@
+"""Накладные расходы метрик на апдейт: python -m bench.metrics
+
+Один и тот же апдейт проходит через диспетчер с пустым хендлером без
+метрик и с UpdateMetricsMiddleware + HandlerMetricsMiddleware (как в
+build_dispatcher при METRICS_ENABLED), отдельно - Histogram.observe.
+"""
+import asyncio
+import timeit
+
+# Первым: настройки бота для бенчмарков
+from bench import per_call, quiet, report
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Message, Update
+
+from middlewares.metrics import HandlerMetricsMiddleware, UpdateMetricsMiddleware
+from services.metrics import Histogram
+from tests.telegram import message_update
+
+
+def build(with_metrics: bool) -> Dispatcher:
+    dp = Dispatcher()
+    router = Router()
+
+    @router.message()
+    async def noop(message: Message):
+        pass
+
+    if with_metrics:
+        dp.update.outer_middleware(UpdateMetricsMiddleware())
+        dp.message.middleware(HandlerMetricsMiddleware())
+    dp.include_router(router)
+    return dp
+
+
+async def main():
+    quiet()
+    bot = Bot('42:BENCH')
+    update = Update.model_validate(message_update(12345, 'Турция'), context={'bot': bot})
+
+    bare = build(False)
+    metered = build(True)
+    without = await per_call(lambda: bare.feed_update(bot, update))
+    with_metrics = await per_call(lambda: metered.feed_update(bot, update))
+    report('Апдейт без метрик', without)
+    report('Апдейт с метриками', with_metrics, without)
+
+    histogram = Histogram('bench_seconds', 'bench', ('handler',))
+    number = 200000
+    observe = min(timeit.repeat(lambda: histogram.observe(0.003, 'noop'), number=number, repeat=5)) / number
+    report('Histogram.observe', observe)
+    await bot.session.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
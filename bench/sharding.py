@@ -0,0 +1,83 @@
+"""Пропускная способность по числу процессов: python -m bench.sharding [процессы ...]
+
+Маршрутизатор раскладывает по ShardPool апдейты /start от разных
+пользователей, рабочие процессы обрабатывают их диспетчером из
+build_dispatcher с ботом без сети. Замеряется время от первого апдейта
+до завершения всех процессов (запуск процессов не учитывается).
+Рост близок к линейному, пока процессов не больше ядер CPU.
+"""
+import asyncio
+import os
+import sys
+import time
+
+# Первым: настройки бота для бенчмарков
+from bench import quiet
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from services.sharding import ShardPool, serve_shard
+from tests.telegram import create_bot, message_update
+
+UPDATES = 10000
+
+
+class BenchPool(ShardPool):
+    """ShardPool, рабочие процессы которого сообщают о готовности"""
+
+    def __init__(self, workers: int):
+        super().__init__(run_worker, workers=workers, queue_size=UPDATES)
+        self.ready = self._ctx.Queue()
+
+    def _spawn(self, index: int):
+        process = self._ctx.Process(
+            target=self.target,
+            args=(index, self.queues[index], self.ready),
+            name=f'shard-{index}'
+        )
+        process.start()
+        self.processes[index] = process
+
+
+def run_worker(index: int, updates, ready):
+    asyncio.run(worker_main(index, updates, ready))
+
+
+async def worker_main(index: int, updates, ready):
+    # main настраивает логирование при импорте
+    from main import build_dispatcher
+    quiet()
+    bot = create_bot()
+    dp = build_dispatcher(MemoryStorage(), primary=index == 0)
+    ready.put(index)
+    await serve_shard(updates, lambda update: dp.feed_raw_update(bot, update), drain_timeout=60)
+
+
+async def measure(workers: int, updates: list) -> float:
+    """Апдейтов в секунду при workers процессах"""
+    pool = BenchPool(workers)
+    pool.start()
+    loop = asyncio.get_running_loop()
+    for _ in range(workers):
+        await loop.run_in_executor(None, pool.ready.get)
+
+    started = time.perf_counter()
+    for update in updates:
+        await pool.route(update)
+    await pool.stop(timeout=60)
+    return len(updates) / (time.perf_counter() - started)
+
+
+async def main(counts: list):
+    quiet()
+    # Разные пользователи: очередь планировщика на пользователя не переполняется
+    updates = [message_update(user_id, '/start') for user_id in range(1, UPDATES + 1)]
+    print(f"Ядер CPU: {os.cpu_count()}, апдейтов: {UPDATES}")
+    single = None
+    for workers in counts:
+        rate = await measure(workers, updates)
+        single = single or rate
+        print(f"Процессов: {workers:<3}{rate:10.0f} апд./с  x{rate / single:.2f}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main([int(arg) for arg in sys.argv[1:]] or [1, 2, 4]))
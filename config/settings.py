@@ -26,10 +26,106 @@ class Settings:
     DATABASE_URL = database_url
     # ======================================
     
+    # Режим работы: polling или webhook (встроенный aiohttp-сервер)
+    RUN_MODE = os.getenv('RUN_MODE', 'polling')
+    # Публичный адрес бота, например https://tour-bot.up.railway.app
+    WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+    WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+    # Обязателен в режиме вебхука: Telegram присылает его в X-Telegram-Bot-Api-Secret-Token
+    WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+    # Сколько секунд при остановке дожидаться апдейтов, принятых вебхуком
+    WEBHOOK_DRAIN_TIMEOUT = float(os.getenv('WEBHOOK_DRAIN_TIMEOUT', 10))
+    # Railway передаёт порт в переменной PORT
+    WEBAPP_HOST = os.getenv('WEBAPP_HOST', '0.0.0.0')
+    WEBAPP_PORT = int(os.getenv('PORT', 8080))
+    # Число рабочих процессов (0 - всё в одном процессе). Кэши в памяти
+    # (например, /stats) у каждого процесса свои и сбрасываются только в нём
+    SHARD_WORKERS = int(os.getenv('SHARD_WORKERS', 0))
+    SHARD_QUEUE_SIZE = int(os.getenv('SHARD_QUEUE_SIZE', 10000))
+    # GET /metrics на отдельном внутреннем порту METRICS_PORT (не публиковать!),
+    # рабочие процессы - METRICS_PORT + номер процесса
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    METRICS_HOST = os.getenv('METRICS_HOST', '0.0.0.0')
+    METRICS_PORT = int(os.getenv('METRICS_PORT', 9090))
+    # Трассировка: доля апдейтов (0 - выключена), порог медленного апдейта
+    # и файл JSONL для медленных апдейтов (пусто - только в лог)
+    TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', 0))
+    TRACE_SLOW_MS = float(os.getenv('TRACE_SLOW_MS', 1000))
+    TRACE_EXPORT_FILE = os.getenv('TRACE_EXPORT_FILE', '')
+    
     CREDENTIALS_FILE = "credentials.json"
+    SHEETS_MAX_WORKERS = int(os.getenv('SHEETS_MAX_WORKERS', 2))
+    SHEETS_BATCH_SIZE = int(os.getenv('SHEETS_BATCH_SIZE', 50))
+    SHEETS_FLUSH_INTERVAL_MS = int(os.getenv('SHEETS_FLUSH_INTERVAL_MS', 500))
+    SHEETS_QUEUE_SIZE = int(os.getenv('SHEETS_QUEUE_SIZE', 1000))
+    
+    # Outbox выгрузки в Google Sheets
+    OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 100))
+    OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', 30))
+    OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 10))
+    OUTBOX_RETRY_BASE = float(os.getenv('OUTBOX_RETRY_BASE', 5))
+    OUTBOX_RETRY_MAX = float(os.getenv('OUTBOX_RETRY_MAX', 3600))
+    # Через сколько секунд взятый, но не отмеченный пакет (процесс упал) берётся снова
+    OUTBOX_CLAIM_TIMEOUT = float(os.getenv('OUTBOX_CLAIM_TIMEOUT', 300))
+    
+    # Фоновые действия после ответа пользователю
+    SIDE_EFFECT_CONCURRENCY = int(os.getenv('SIDE_EFFECT_CONCURRENCY', 20))
+    SIDE_EFFECT_DRAIN_TIMEOUT = float(os.getenv('SIDE_EFFECT_DRAIN_TIMEOUT', 10))
+    
+    # Учёт пользователей: запись в БД пакетами раз в USER_FLUSH_INTERVAL сек.,
+    # один пользователь обновляется не чаще раза в USER_TOUCH_INTERVAL сек.
+    USER_FLUSH_INTERVAL = float(os.getenv('USER_FLUSH_INTERVAL', 10))
+    USER_TOUCH_INTERVAL = float(os.getenv('USER_TOUCH_INTERVAL', 300))
+    USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 100000))
+    
+    # FSM: database - в БД с кэшем в памяти, memory - только в памяти
+    FSM_STORAGE = os.getenv('FSM_STORAGE', 'database')
+    FSM_FLUSH_INTERVAL = float(os.getenv('FSM_FLUSH_INTERVAL', 1.0))
+    # Брошенные опросы удаляются через FSM_TTL сек., из памяти - через FSM_CACHE_TTL
+    FSM_TTL = float(os.getenv('FSM_TTL', 3 * 24 * 3600))
+    FSM_CACHE_TTL = float(os.getenv('FSM_CACHE_TTL', 3600))
+    
+    # Сколько последних ключей отправки опроса помнить в памяти
+    SUBMISSION_CACHE_SIZE = int(os.getenv('SUBMISSION_CACHE_SIZE', 10000))
+    
+    # При SHARD_WORKERS > 0 /stats может отставать от новых заявок на это время
+    STATS_CACHE_TTL = float(os.getenv('STATS_CACHE_TTL', 60))
+    STATS_TOP_DESTINATIONS = 5
+    
+    # Экспорт заявок: none, gzip или zip
+    EXPORT_COMPRESSION = os.getenv('EXPORT_COMPRESSION', 'none')
+    EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 1000))
+    EXPORT_SPOOL_SIZE = int(os.getenv('EXPORT_SPOOL_SIZE', 1024 * 1024))
+    # Лимит загрузки файлов ботом в Telegram - 50 МБ
+    EXPORT_PART_SIZE = int(os.getenv('EXPORT_PART_SIZE', 45 * 1024 * 1024))
+    
+    # Рассылка: общий лимит Telegram ~30 сообщений в секунду
+    BROADCAST_RATE = float(os.getenv('BROADCAST_RATE', 25))
+    BROADCAST_CONCURRENCY = int(os.getenv('BROADCAST_CONCURRENCY', 10))
+    BROADCAST_MAX_RETRIES = int(os.getenv('BROADCAST_MAX_RETRIES', 3))
+    BROADCAST_PROGRESS_INTERVAL = float(os.getenv('BROADCAST_PROGRESS_INTERVAL', 5))
+    BROADCAST_COMMIT_BATCH = int(os.getenv('BROADCAST_COMMIT_BATCH', 200))
+    BROADCAST_POLL_INTERVAL = float(os.getenv('BROADCAST_POLL_INTERVAL', 30))
+    # Перечитывать locales/*.json при изменении (для разработки)
+    I18N_WATCH = os.getenv('I18N_WATCH', 'false').lower() == 'true'
+    I18N_WATCH_INTERVAL = float(os.getenv('I18N_WATCH_INTERVAL', 2))
+    
     MIN_BUDGET = 10000
     MIN_TRAVELERS = 1
     MAX_TRAVELERS = 20
-    THROTTLE_TIME = 1.0
+    # Планировщик: не более SCHEDULER_MAX_INFLIGHT хендлеров одновременно,
+    # у пользователя в очереди не более SCHEDULER_USER_QUEUE апдейтов
+    SCHEDULER_MAX_INFLIGHT = int(os.getenv('SCHEDULER_MAX_INFLIGHT', 100))
+    SCHEDULER_USER_QUEUE = int(os.getenv('SCHEDULER_USER_QUEUE', 3))
+    # Антиспам: 1 запрос в THROTTLE_TIME сек. с запасом THROTTLE_BURST запросов
+    THROTTLE_TIME = float(os.getenv('THROTTLE_TIME', 1.0))
+    THROTTLE_BURST = int(os.getenv('THROTTLE_BURST', 3))
+    THROTTLE_TTL = float(os.getenv('THROTTLE_TTL', 600))
+    THROTTLE_MAX_USERS = int(os.getenv('THROTTLE_MAX_USERS', 50000))
+    # memory - в памяти процесса, redis - общее для всех реплик
+    THROTTLE_STORAGE = os.getenv('THROTTLE_STORAGE', 'memory')
+    REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+    # Таймаут запроса к Redis (сек.); при ошибке апдейт пропускается без ограничения
+    REDIS_TIMEOUT = float(os.getenv('REDIS_TIMEOUT', 0.5))
 
 settings = Settings()
@@ -1,3 +1,3 @@
-from .engine import init_db, get_session, async_session_maker
-from .models import Base, User, TourRequest
-__all__ = ['init_db', 'get_session', 'async_session_maker', 'Base', 'User', 'TourRequest']
+from .database import init_db, get_session, async_session_maker
+from .models import Base, User, Request
+__all__ = ['init_db', 'get_session', 'async_session_maker', 'Base', 'User', 'Request']
@@ -1,14 +1,21 @@
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from config.settings import settings
 from database.models import Base
+from database.migrations import lock_migrations, run_migrations
+from services.metrics import instrument_engine
 
 engine = create_async_engine(settings.DATABASE_URL, echo=False)
+# Хуки на каждый запрос нужны только метрикам и трассировке
+if settings.METRICS_ENABLED or settings.TRACE_SAMPLE_RATE > 0:
+    instrument_engine(engine.sync_engine)
 async_session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 async def init_db():
     """Инициализация базы данных"""
     async with engine.begin() as conn:
+        await lock_migrations(conn)
         await conn.run_sync(Base.metadata.create_all)
+        await run_migrations(conn)
 
 async def get_session() -> AsyncSession:
     """Получение сессии БД"""
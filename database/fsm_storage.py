@@ -0,0 +1,205 @@
+import asyncio
+import contextvars
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from sqlalchemy import delete
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from config.settings import settings
+from database.models import FSMRecord
+
+logger = logging.getLogger(__name__)
+
+
+def _key(key: StorageKey) -> str:
+    return ':'.join(str(part) if part is not None else '' for part in (
+        key.bot_id,
+        key.chat_id,
+        key.user_id,
+        key.thread_id,
+        key.business_connection_id,
+        key.destiny,
+    ))
+
+
+class _Entry:
+    __slots__ = ('state', 'data', 'touched')
+
+    def __init__(self, state: Optional[str], data: Dict[str, Any]):
+        self.state = state
+        self.data = data
+        self.touched = time.monotonic()
+
+
+class DatabaseStorage(BaseStorage):
+    """FSM-хранилище в БД с кэшем в памяти
+
+    Чтения обслуживаются из памяти (из БД только первое обращение
+    к ключу), а изменения копятся и записываются фоновой задачей раз
+    в flush_interval секунд одним пакетом. Незавершённые опросы старше
+    ttl секунд удаляются и из памяти, и из БД.
+    """
+
+    def __init__(
+        self,
+        session_maker: async_sessionmaker,
+        flush_interval: float = settings.FSM_FLUSH_INTERVAL,
+        ttl: float = settings.FSM_TTL,
+        cache_ttl: float = settings.FSM_CACHE_TTL
+    ):
+        self.session_maker = session_maker
+        self.flush_interval = flush_interval
+        self.ttl = ttl
+        self.cache_ttl = cache_ttl
+        self._cache: Dict[str, _Entry] = {}
+        self._dirty: set[str] = set()
+        self._task: asyncio.Task | None = None
+        self._last_cleanup = 0.0
+
+    async def _entry(self, key: StorageKey) -> _Entry:
+        """Запись из кэша, при промахе - из БД"""
+        db_key = _key(key)
+        entry = self._cache.get(db_key)
+        if entry is not None:
+            entry.touched = time.monotonic()
+            return entry
+
+        async with self.session_maker() as session:
+            record = await session.get(FSMRecord, db_key)
+
+        if record is not None and record.updated_at < datetime.now() - timedelta(seconds=self.ttl):
+            record = None
+
+        loaded = _Entry(record.state, dict(record.data or {})) if record else _Entry(None, {})
+        # Пока шёл запрос, ключ мог быть изменён - не затираем
+        return self._cache.setdefault(db_key, loaded)
+
+    def _mark_dirty(self, key: StorageKey):
+        self._dirty.add(_key(key))
+        if self._task is None or self._task.done():
+            # Задача живёт дольше апдейта, который её создал: без его
+            # correlation id и трассировки (пустой контекст)
+            self._task = asyncio.create_task(
+                self._run(),
+                name='fsm-storage-flush',
+                context=contextvars.Context()
+            )
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        entry = await self._entry(key)
+        entry.state = state.state if isinstance(state, State) else state
+        self._mark_dirty(key)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._entry(key)).state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        entry = await self._entry(key)
+        entry.data = data.copy()
+        self._mark_dirty(key)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._entry(key)).data.copy()
+
+    async def transition(
+        self,
+        key: StorageKey,
+        state: StateType = None,
+        data: Optional[Dict[str, Any]] = None,
+        replace: bool = False
+    ) -> Dict[str, Any]:
+        """Смена состояния и данных одной операцией
+
+        Данные объединяются с текущими (или заменяют их при replace=True),
+        возвращается копия итоговых данных.
+        """
+        entry = await self._entry(key)
+        if replace:
+            entry.data = dict(data or {})
+        elif data:
+            entry.data.update(data)
+        entry.state = state.state if isinstance(state, State) else state
+        self._mark_dirty(key)
+        return entry.data.copy()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                if time.monotonic() - self._last_cleanup >= self.flush_interval * 60:
+                    await self.cleanup()
+            except Exception as e:
+                logger.error(f"Ошибка записи FSM в БД: {e}")
+
+    async def flush(self):
+        """Запись изменённых ключей одним commit"""
+        if not self._dirty:
+            return
+
+        keys, self._dirty = self._dirty, set()
+        rows, empty = [], []
+        now = datetime.now()
+        for db_key in keys:
+            entry = self._cache.get(db_key)
+            if entry is None:
+                continue
+            if entry.state is None and not entry.data:
+                empty.append(db_key)
+            else:
+                rows.append({'key': db_key, 'state': entry.state, 'data': entry.data, 'updated_at': now})
+
+        try:
+            async with self.session_maker() as session:
+                if rows:
+                    insert = postgresql.insert if session.bind.dialect.name == 'postgresql' else sqlite.insert
+                    stmt = insert(FSMRecord).values(rows)
+                    await session.execute(stmt.on_conflict_do_update(
+                        index_elements=[FSMRecord.key],
+                        set_={
+                            'state': stmt.excluded.state,
+                            'data': stmt.excluded.data,
+                            'updated_at': stmt.excluded.updated_at,
+                        }
+                    ))
+                if empty:
+                    await session.execute(delete(FSMRecord).where(FSMRecord.key.in_(empty)))
+                await session.commit()
+        except Exception:
+            # Запишем при следующем сбросе
+            self._dirty |= keys
+            raise
+
+    async def cleanup(self):
+        """Удаление брошенных опросов и вытеснение неактивных ключей из памяти"""
+        self._last_cleanup = time.monotonic()
+        now = time.monotonic()
+
+        for db_key, entry in list(self._cache.items()):
+            idle = now - entry.touched
+            if idle >= self.ttl:
+                del self._cache[db_key]
+                self._dirty.discard(db_key)
+            elif idle >= self.cache_ttl and db_key not in self._dirty:
+                del self._cache[db_key]
+
+        async with self.session_maker() as session:
+            await session.execute(
+                delete(FSMRecord).where(FSMRecord.updated_at < datetime.now() - timedelta(seconds=self.ttl))
+            )
+            await session.commit()
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
@@ -0,0 +1,80 @@
+import logging
+from datetime import datetime
+from sqlalchemy import inspect, select, text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from database.models import SchemaMigration
+
+logger = logging.getLogger(__name__)
+
+# Ключ advisory-блокировки, чтобы миграции не шли параллельно с нескольких реплик
+MIGRATION_LOCK_ID = 7324001
+
+def add_column(table: str, column: str, ddl: str):
+    """Шаг миграции: добавление колонки, если её ещё нет (в новой БД её создаёт create_all)"""
+    async def step(conn: AsyncConnection):
+        columns = await conn.run_sync(
+            lambda sync_conn: [c['name'] for c in inspect(sync_conn).get_columns(table)]
+        )
+        if column not in columns:
+            await conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+    return step
+
+
+# Версионированные миграции схемы: (версия, описание, SQL-команды).
+# Команды должны работать и в SQLite, и в PostgreSQL (шаг может быть
+# и функцией от соединения). Новые таблицы создаёт create_all, здесь
+# только изменения уже существующих.
+MIGRATIONS = [
+    (1, 'Индексы таблицы requests', [
+        "CREATE INDEX IF NOT EXISTS ix_requests_created_at_id ON requests (created_at, id)",
+        "CREATE INDEX IF NOT EXISTS ix_requests_user_id ON requests (user_id)",
+        "CREATE INDEX IF NOT EXISTS ix_requests_destination ON requests (destination)",
+    ]),
+    (2, 'Заполнение users по существующим заявкам', [
+        # WHERE true нужен SQLite для разбора INSERT ... SELECT ... ON CONFLICT
+        "INSERT INTO users (id, username, is_blocked, first_seen, last_seen) "
+        "SELECT user_id, MAX(username), false, MIN(created_at), MAX(created_at) "
+        "FROM requests WHERE true GROUP BY user_id "
+        "ON CONFLICT (id) DO NOTHING",
+    ]),
+    (3, 'Ключ отправки опроса в requests', [
+        add_column('requests', 'submission_key', 'VARCHAR(64)'),
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_requests_submission_key ON requests (submission_key)",
+    ]),
+]
+
+
+async def lock_migrations(conn: AsyncConnection):
+    """Блокировка до конца транзакции, чтобы реплики не меняли схему одновременно
+
+    Берётся до create_all: иначе две реплики создают одни и те же таблицы
+    параллельно и одна из них падает на дубликате.
+    """
+    if conn.dialect.name == 'postgresql':
+        await conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {'id': MIGRATION_LOCK_ID})
+
+
+async def run_migrations(conn: AsyncConnection):
+    """Применение недостающих миграций в рамках текущей транзакции (после lock_migrations)"""
+    result = await conn.execute(select(SchemaMigration.version))
+    applied = set(result.scalars().all())
+
+    for version, description, statements in MIGRATIONS:
+        if version in applied:
+            continue
+
+        for statement in statements:
+            if callable(statement):
+                await statement(conn)
+            else:
+                await conn.execute(text(statement))
+
+        await conn.execute(
+            SchemaMigration.__table__.insert().values(
+                version=version,
+                description=description,
+                applied_at=datetime.now()
+            )
+        )
+        logger.info(f"Применена миграция {version}: {description}")
@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import String, Integer, DateTime, Text
+from sqlalchemy import String, Integer, BigInteger, Boolean, DateTime, Text, JSON, ForeignKey, Index
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
 class Base(DeclarativeBase):
@@ -7,6 +7,16 @@ class Base(DeclarativeBase):
 
 class Request(Base):
     __tablename__ = 'requests'
+    __table_args__ = (
+        # Фильтры по периоду, сортировка и постраничный вывод
+        Index('ix_requests_created_at_id', 'created_at', 'id'),
+        # Уникальные пользователи и рассылка
+        Index('ix_requests_user_id', 'user_id'),
+        # ТОП направлений
+        Index('ix_requests_destination', 'destination'),
+        # Защита от повторной отправки опроса
+        Index('ux_requests_submission_key', 'submission_key', unique=True),
+    )
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     user_id: Mapped[int] = mapped_column(Integer, nullable=False)
@@ -19,6 +29,113 @@ class Request(Base):
     budget: Mapped[int] = mapped_column(Integer, nullable=False)
     comment: Mapped[str] = mapped_column(Text, nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
+    # Ключ отправки опроса: повторная доставка того же опроса не создаёт дубль
+    submission_key: Mapped[str] = mapped_column(String(64), nullable=True)
     
     def __repr__(self):
         return f"<Request {self.id}: {self.destination}>"
+
+
+class User(Base):
+    """Пользователь бота (аудитория рассылок и статистики)"""
+    __tablename__ = 'users'
+    __table_args__ = (
+        # Получатели рассылки
+        Index('ix_users_is_blocked_id', 'is_blocked', 'id'),
+    )
+    
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=False)
+    username: Mapped[str] = mapped_column(String(100), nullable=True)
+    language: Mapped[str] = mapped_column(String(10), nullable=True)
+    is_blocked: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
+    first_seen: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
+    last_seen: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
+    
+    def __repr__(self):
+        return f"<User {self.id}: @{self.username}>"
+
+
+class SheetsOutbox(Base):
+    """Очередь выгрузки заявок в Google Sheets"""
+    __tablename__ = 'sheets_outbox'
+    
+    PENDING = 'pending'
+    SENT = 'sent'
+    DEAD = 'dead'
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    request_id: Mapped[int] = mapped_column(Integer, ForeignKey('requests.id', ondelete='SET NULL'), nullable=True)
+    payload: Mapped[list] = mapped_column(JSON, nullable=False)
+    status: Mapped[str] = mapped_column(String(10), nullable=False, default=PENDING, index=True)
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    last_error: Mapped[str] = mapped_column(Text, nullable=True)
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
+    sent_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f"<SheetsOutbox {self.id}: {self.status}>"
+
+
+class BroadcastJob(Base):
+    """Задание рассылки"""
+    __tablename__ = 'broadcast_jobs'
+    
+    RUNNING = 'running'
+    PAUSED = 'paused'
+    CANCELLED = 'cancelled'
+    DONE = 'done'
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    from_chat_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    message_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    status: Mapped[str] = mapped_column(String(10), nullable=False, default=RUNNING, index=True)
+    total: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    sent: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    blocked: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    failed: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    status_chat_id: Mapped[int] = mapped_column(BigInteger, nullable=True)
+    status_message_id: Mapped[int] = mapped_column(Integer, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
+    finished_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+    
+    @property
+    def done(self) -> int:
+        return self.sent + self.blocked + self.failed
+    
+    def __repr__(self):
+        return f"<BroadcastJob {self.id}: {self.status}>"
+
+
+class BroadcastDelivery(Base):
+    """Состояние доставки рассылки одному получателю"""
+    __tablename__ = 'broadcast_deliveries'
+    __table_args__ = (
+        Index('ix_broadcast_deliveries_job_status', 'job_id', 'status'),
+    )
+    
+    PENDING = 'pending'
+    
+    job_id: Mapped[int] = mapped_column(Integer, ForeignKey('broadcast_jobs.id', ondelete='CASCADE'), primary_key=True)
+    user_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    status: Mapped[str] = mapped_column(String(10), nullable=False, default=PENDING)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+
+class FSMRecord(Base):
+    """Состояние FSM пользователя (незавершённые опросы)"""
+    __tablename__ = 'fsm_states'
+    
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    state: Mapped[str] = mapped_column(String(100), nullable=True)
+    data: Mapped[dict] = mapped_column(JSON, nullable=False, default=dict)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now, index=True)
+
+
+class SchemaMigration(Base):
+    """Применённые миграции схемы"""
+    __tablename__ = 'schema_migrations'
+    
+    version: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    description: Mapped[str] = mapped_column(String(200), nullable=False)
+    applied_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
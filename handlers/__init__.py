@@ -1,2 +1,2 @@
-from . import start, tour_request
-__all__ = ['start', 'tour_request']
+from . import start, survey, admin
+__all__ = ['start', 'survey', 'admin']
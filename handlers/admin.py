@@ -1,15 +1,16 @@
-import csv
-import io
 from datetime import datetime, timedelta
-from aiogram import Router, F
-from aiogram.filters import Command
-from aiogram.types import Message, CallbackQuery, BufferedInputFile
+from aiogram import Router
+from aiogram.filters import BaseFilter, Command, StateFilter
+from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from sqlalchemy import select, func, and_
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from database.models import Request
+from database.models import Request, BroadcastJob, User
 from config.settings import settings
+from services.stats_cache import stats_cache
+from services.export import COMPRESSIONS, RequestsExport, export_cache
+from services.broadcast import broadcast_worker, job_status_text
 
 router = Router()
 
@@ -19,9 +20,9 @@ def is_admin(user_id: int) -> bool:
     return user_id == settings.ADMIN_CHAT_ID
 
 # Декоратор для админских команд
-class AdminFilter:
+class AdminFilter(BaseFilter):
     async def __call__(self, message: Message) -> bool:
-        return is_admin(message.from_user.id)
+        return message.from_user is not None and is_admin(message.from_user.id)
 
 admin_filter = AdminFilter()
 
@@ -42,6 +43,7 @@ async def cmd_admin(message: Message, t):
         f"🔍 /search [ID] - Поиск заявки по ID\n"
         f"🗑 /delete [ID] - Удалить заявку\n"
         f"📢 /broadcast - Рассылка сообщения всем пользователям\n"
+        f"📊 /bc_status - Статус рассылок\n"
         f"💡 /help_admin - Справка по командам"
     )
     
@@ -52,48 +54,44 @@ async def cmd_admin(message: Message, t):
 async def cmd_stats(message: Message, session: AsyncSession, t):
     """Статистика заявок"""
     
-    # Общее количество заявок
-    total_result = await session.execute(select(func.count(Request.id)))
-    total_requests = total_result.scalar()
+    cached = stats_cache.get()
+    if cached is not None:
+        await message.answer(cached, parse_mode='HTML')
+        return
     
-    # Заявки за сегодня
     today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-    today_result = await session.execute(
-        select(func.count(Request.id)).where(Request.created_at >= today_start)
-    )
-    today_requests = today_result.scalar()
-    
-    # Заявки за неделю
     week_start = datetime.now() - timedelta(days=7)
-    week_result = await session.execute(
-        select(func.count(Request.id)).where(Request.created_at >= week_start)
-    )
-    week_requests = week_result.scalar()
-    
-    # Заявки за месяц
     month_start = datetime.now() - timedelta(days=30)
-    month_result = await session.execute(
-        select(func.count(Request.id)).where(Request.created_at >= month_start)
-    )
-    month_requests = month_result.scalar()
     
-    # Общий бюджет всех заявок
-    budget_result = await session.execute(select(func.sum(Request.budget)))
-    total_budget = budget_result.scalar() or 0
+    # Все агрегаты одним запросом
+    totals_result = await session.execute(
+        select(
+            func.count(Request.id),
+            func.count(Request.id).filter(Request.created_at >= today_start),
+            func.count(Request.id).filter(Request.created_at >= week_start),
+            func.count(Request.id).filter(Request.created_at >= month_start),
+            func.coalesce(func.sum(Request.budget), 0),
+            select(func.count(User.id)).scalar_subquery()
+        )
+    )
+    (
+        total_requests,
+        today_requests,
+        week_requests,
+        month_requests,
+        total_budget,
+        unique_users
+    ) = totals_result.one()
     
     # Средний бюджет
     avg_budget = total_budget / total_requests if total_requests > 0 else 0
     
-    # Уникальные пользователи
-    unique_users_result = await session.execute(select(func.count(func.distinct(Request.user_id))))
-    unique_users = unique_users_result.scalar()
-    
-    # ТОП-5 направлений
+    # ТОП направлений
     top_destinations_result = await session.execute(
         select(Request.destination, func.count(Request.id).label('count'))
         .group_by(Request.destination)
         .order_by(func.count(Request.id).desc())
-        .limit(5)
+        .limit(settings.STATS_TOP_DESTINATIONS)
     )
     top_destinations = top_destinations_result.all()
     
@@ -114,6 +112,7 @@ async def cmd_stats(message: Message, session: AsyncSession, t):
     for idx, (destination, count) in enumerate(top_destinations, 1):
         text += f"{idx}. {destination}: {count} заявок\n"
     
+    stats_cache.set(text)
     await message.answer(text, parse_mode='HTML')
 
 
@@ -148,50 +147,42 @@ async def cmd_requests(message: Message, session: AsyncSession, t):
 async def cmd_export(message: Message, session: AsyncSession, t):
     """Экспорт всех заявок в CSV"""
     
-    result = await session.execute(select(Request).order_by(Request.created_at.desc()))
-    requests = result.scalars().all()
+    # Необязательный аргумент: /export gzip или /export zip
+    args = message.text.split()
+    compression = args[1].lower() if len(args) > 1 else settings.EXPORT_COMPRESSION
     
-    if not requests:
-        await message.answer("📭 Нет заявок для экспорта", parse_mode='HTML')
-        return
+    if compression not in COMPRESSIONS:
+        compression = 'none'
     
-    # Создание CSV в памяти
-    output = io.StringIO()
-    writer = csv.writer(output, delimiter=';')
-    
-    # Заголовки
-    writer.writerow([
-        'ID', 'User ID', 'Username', 'Направление', 'Дата вылета',
-        'Ночей', 'Взрослых', 'Детей', 'Бюджет', 'Комментарий', 'Создана'
-    ])
+    # Таблица не изменилась - пересылаем уже загруженные файлы
+    fingerprint = await export_cache.fingerprint(session, compression)
+    cached = export_cache.get(fingerprint)
+    if cached:
+        for file_id, caption in cached:
+            await message.answer_document(document=file_id, caption=caption)
+        return
     
-    # Данные
-    for req in requests:
-        writer.writerow([
-            req.id,
-            req.user_id,
-            req.username or 'N/A',
-            req.destination,
-            req.departure_date,
-            req.nights,
-            req.adults,
-            req.children,
-            req.budget,
-            req.comment or 'Нет',
-            req.created_at.strftime('%d.%m.%Y %H:%M')
-        ])
-    
-    # Конвертация в байты для отправки
-    csv_bytes = output.getvalue().encode('utf-8-sig')  # BOM для корректного открытия в Excel
-    output.close()
-    
-    # Отправка файла
-    file = BufferedInputFile(csv_bytes, filename=f"requests_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
-    
-    await message.answer_document(
-        document=file,
-        caption=f"📥 Экспорт завершен\n\nВсего заявок: {len(requests)}"
-    )
+    export = RequestsExport(compression)
+    try:
+        await export.build(session)
+        
+        if not export.total:
+            await message.answer("📭 Нет заявок для экспорта", parse_mode='HTML')
+            return
+        
+        # Отправка файлов (по частям, если экспорт не помещается в один документ)
+        documents = []
+        for idx, part in enumerate(export.parts, 1):
+            caption = f"📥 Экспорт завершен\n\nВсего заявок: {export.total}"
+            if len(export.parts) > 1:
+                caption += f"\nЧасть {idx} из {len(export.parts)} ({part.rows} заявок)"
+            
+            sent = await message.answer_document(document=part.input_file(), caption=caption)
+            documents.append((sent.document.file_id, caption))
+        
+        export_cache.set(fingerprint, documents)
+    finally:
+        export.close()
 
 
 @router.message(Command("today"), AdminFilter())
@@ -281,6 +272,8 @@ async def cmd_delete(message: Message, session: AsyncSession, t):
     
     await session.delete(req)
     await session.commit()
+    stats_cache.invalidate()
+    export_cache.note_delete()
     
     await message.answer(
         f"🗑 <b>Заявка #{request_id} удалена</b>\n\n"
@@ -304,7 +297,7 @@ async def cmd_broadcast(message: Message, session: AsyncSession, state: FSMConte
     await state.set_state("broadcast_waiting")
 
 
-@router.message(F.state == "broadcast_waiting", AdminFilter())
+@router.message(StateFilter("broadcast_waiting"), AdminFilter())
 async def process_broadcast(message: Message, session: AsyncSession, state: FSMContext, t):
     """Обработка и отправка рассылки"""
     
@@ -313,51 +306,140 @@ async def process_broadcast(message: Message, session: AsyncSession, state: FSMC
         await message.answer("❌ Рассылка отменена", parse_mode='HTML')
         return
     
-    # Получение уникальных user_id
-    result = await session.execute(select(func.distinct(Request.user_id)))
-    user_ids = [row[0] for row in result.all()]
+    # Получатели - все пользователи, не заблокировавшие бота
+    result = await session.execute(select(User.id).where(User.is_blocked == False))
+    user_ids = result.scalars().all()
     
     if not user_ids:
         await message.answer("📭 Нет пользователей для рассылки", parse_mode='HTML')
         await state.clear()
         return
     
-    # Отправка рассылки
-    success_count = 0
-    failed_count = 0
-    
     status_msg = await message.answer(
         f"📤 Рассылка началась...\n\n"
         f"Всего пользователей: {len(user_ids)}",
         parse_mode='HTML'
     )
     
-    for user_id in user_ids:
-        try:
-            await message.bot.copy_message(
-                chat_id=user_id,
-                from_chat_id=message.chat.id,
-                message_id=message.message_id
-            )
-            success_count += 1
-        except Exception as e:
-            failed_count += 1
-            # Логирование ошибок (пользователь заблокировал бота и т.д.)
-            print(f"Ошибка отправки пользователю {user_id}: {e}")
-    
-    # Обновление статуса
-    await status_msg.edit_text(
-        f"✅ <b>Рассылка завершена</b>\n\n"
-        f"📊 Статистика:\n"
-        f"├ Успешно: {success_count}\n"
-        f"├ Ошибок: {failed_count}\n"
-        f"└ Всего: {len(user_ids)}",
+    # Задание сохраняется в БД и выполняется в фоне
+    job = await broadcast_worker.create_job(
+        session,
+        from_chat_id=message.chat.id,
+        message_id=message.message_id,
+        user_ids=user_ids,
+        status_chat_id=status_msg.chat.id,
+        status_message_id=status_msg.message_id
+    )
+    
+    await message.answer(
+        f"📢 Рассылка <b>#{job.id}</b> запущена\n\n"
+        f"⏸ /bc_pause {job.id} - Пауза\n"
+        f"▶️ /bc_resume {job.id} - Продолжить\n"
+        f"❌ /bc_cancel {job.id} - Отменить\n"
+        f"📊 /bc_status {job.id} - Статус",
         parse_mode='HTML'
     )
     
     await state.clear()
 
 
+async def _get_broadcast_job(message: Message, session: AsyncSession, command: str) -> BroadcastJob | None:
+    """Задание рассылки по ID из команды"""
+    try:
+        job_id = int(message.text.split()[1])
+    except (IndexError, ValueError):
+        await message.answer(f"❌ Использование: /{command} [ID]\n\nПример: /{command} 3", parse_mode='HTML')
+        return None
+    
+    job = await session.get(BroadcastJob, job_id)
+    if not job:
+        await message.answer(f"❌ Рассылка #{job_id} не найдена", parse_mode='HTML')
+    return job
+
+
+@router.message(Command("bc_status"), AdminFilter())
+async def cmd_broadcast_status(message: Message, session: AsyncSession, t):
+    """Статус рассылки (без ID - последние задания)"""
+    
+    if len(message.text.split()) < 2:
+        result = await session.execute(
+            select(BroadcastJob).order_by(BroadcastJob.id.desc()).limit(5)
+        )
+        jobs = result.scalars().all()
+        
+        if not jobs:
+            await message.answer("📭 Рассылок пока нет", parse_mode='HTML')
+            return
+        
+        text = "📢 <b>Последние рассылки:</b>\n\n"
+        for job in jobs:
+            text += f"#{job.id} | {job.status} | {job.done}/{job.total} | {job.created_at.strftime('%d.%m %H:%M')}\n"
+        await message.answer(text, parse_mode='HTML')
+        return
+    
+    job = await _get_broadcast_job(message, session, 'bc_status')
+    if job:
+        await message.answer(job_status_text(job), parse_mode='HTML')
+
+
+@router.message(Command("bc_pause"), AdminFilter())
+async def cmd_broadcast_pause(message: Message, session: AsyncSession, t):
+    """Пауза рассылки"""
+    
+    job = await _get_broadcast_job(message, session, 'bc_pause')
+    if not job:
+        return
+    
+    if job.status != BroadcastJob.RUNNING:
+        await message.answer(f"❌ Рассылка #{job.id} не выполняется ({job.status})", parse_mode='HTML')
+        return
+    
+    job.status = BroadcastJob.PAUSED
+    await session.commit()
+    broadcast_worker.interrupt(job.id)
+    
+    await message.answer(f"⏸ Рассылка #{job.id} поставлена на паузу", parse_mode='HTML')
+
+
+@router.message(Command("bc_resume"), AdminFilter())
+async def cmd_broadcast_resume(message: Message, session: AsyncSession, t):
+    """Продолжение рассылки"""
+    
+    job = await _get_broadcast_job(message, session, 'bc_resume')
+    if not job:
+        return
+    
+    if job.status != BroadcastJob.PAUSED:
+        await message.answer(f"❌ Рассылка #{job.id} не на паузе ({job.status})", parse_mode='HTML')
+        return
+    
+    job.status = BroadcastJob.RUNNING
+    await session.commit()
+    broadcast_worker.wake()
+    
+    await message.answer(f"▶️ Рассылка #{job.id} продолжена", parse_mode='HTML')
+
+
+@router.message(Command("bc_cancel"), AdminFilter())
+async def cmd_broadcast_cancel(message: Message, session: AsyncSession, t):
+    """Отмена рассылки"""
+    
+    job = await _get_broadcast_job(message, session, 'bc_cancel')
+    if not job:
+        return
+    
+    if job.status not in (BroadcastJob.RUNNING, BroadcastJob.PAUSED):
+        await message.answer(f"❌ Рассылка #{job.id} уже завершена ({job.status})", parse_mode='HTML')
+        return
+    
+    job.status = BroadcastJob.CANCELLED
+    job.finished_at = datetime.now()
+    await session.commit()
+    broadcast_worker.interrupt(job.id)
+    
+    await message.answer(f"❌ Рассылка #{job.id} отменена", parse_mode='HTML')
+
+
 @router.message(Command("help_admin"), AdminFilter())
 async def cmd_help_admin(message: Message, t):
     """Справка по админ-командам"""
@@ -373,7 +455,8 @@ async def cmd_help_admin(message: Message, t):
         f"<b>📋 /requests</b>\n"
         f"Выводит последние 10 заявок с кратким описанием\n\n"
         f"<b>📥 /export</b>\n"
-        f"Экспортирует ВСЕ заявки в CSV-файл (можно открыть в Excel)\n\n"
+        f"Экспортирует ВСЕ заявки в CSV-файл (можно открыть в Excel)\n"
+        f"<code>/export gzip</code> или <code>/export zip</code> - со сжатием\n\n"
         f"<b>📅 /today</b>\n"
         f"Показывает все заявки за текущий день\n\n"
         f"<b>🔍 /search [ID]</b>\n"
@@ -384,11 +467,15 @@ async def cmd_help_admin(message: Message, t):
         f"Пример: <code>/delete 42</code>\n\n"
         f"<b>📢 /broadcast</b>\n"
         f"Запускает режим рассылки сообщения всем пользователям бота\n"
-        f"После команды отправьте любое сообщение (текст/фото/видео)\n\n"
+        f"После команды отправьте любое сообщение (текст/фото/видео)\n"
+        f"Рассылка идёт в фоне и продолжается после перезапуска бота\n\n"
+        f"<b>📊 /bc_status [ID]</b>\n"
+        f"Статус рассылки, без ID - список последних рассылок\n"
+        f"Управление: <code>/bc_pause ID</code>, <code>/bc_resume ID</code>, <code>/bc_cancel ID</code>\n\n"
         f"<b>Дополнительно:</b>\n"
         f"• Все команды работают только для админа (ID: {settings.ADMIN_CHAT_ID})\n"
         f"• CSV файлы сохраняются с BOM (корректно открываются в Excel с кириллицей)\n"
-        f"• При рассылке игнорируются пользователи, заблокировавшие бота"
+        f"• При рассылке пропускаются пользователи, заблокировавшие бота"
     )
     
     await message.answer(text, parse_mode='HTML')
@@ -1,16 +1,18 @@
+from uuid import uuid4
 from aiogram import Router, F
 from aiogram.filters import CommandStart
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from keyboards.inline import main_menu_kb
-from states.survey import SurveyStates
+from states.survey import SURVEY
+from states.transition import advance, finish
 
 router = Router()
 
 @router.message(CommandStart())
 async def cmd_start(message: Message, state: FSMContext, t):
     """Обработчик команды /start"""
-    await state.clear()
+    await finish(state)
     await message.answer(
         text=t('welcome'),
         reply_markup=main_menu_kb(t)
@@ -19,11 +21,10 @@ async def cmd_start(message: Message, state: FSMContext, t):
 @router.callback_query(F.data == 'start_survey')
 async def start_survey(callback: CallbackQuery, state: FSMContext, t):
     """Начало опроса"""
-    from keyboards.inline import progress_bar, back_kb
-    
     await callback.message.edit_text(
-        text=f"{progress_bar(1)}\n\n{t('start_survey')}",
-        reply_markup=back_kb(t)
+        text=SURVEY.render(SURVEY.first, t, {}),
+        reply_markup=SURVEY.first.keyboard(t)
     )
-    await state.set_state(SurveyStates.destination)
+    # survey_id - ключ отправки этого опроса (защита от дублей)
+    await advance(state, SURVEY.first.state, replace=True, survey_id=uuid4().hex)
     await callback.answer()
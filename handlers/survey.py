@@ -1,149 +1,59 @@
-from datetime import datetime
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery
+from aiogram.filters import StateFilter
+from aiogram.types import Message, CallbackQuery, Update
 from aiogram.fsm.context import FSMContext
-from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from database.models import Request
-from states.survey import SurveyStates
-from keyboards.inline import back_kb, skip_kb, progress_bar, main_menu_kb
-from config.settings import settings
-from services.google_sheets import save_to_sheets
+from states.survey import SURVEY, SurveyError, PROMPT_CONSTANTS
+from states.transition import advance, finish
+from keyboards.inline import back_kb, main_menu_kb
+from services.sheets_outbox import add_to_outbox, sheets_outbox
 from services.notification import notify_admin
+from services.background import side_effects
+from services.stats_cache import stats_cache
+from services.submissions import find_submission, recent_submissions, submission_key
+from services.tracing import span
 
 router = Router()
 
-@router.message(SurveyStates.destination)
-async def process_destination(message: Message, state: FSMContext, t):
-    """Обработка направления"""
-    await state.update_data(destination=message.text.strip())
+# Ответы, без которых заявку не создать (все шаги, кроме комментария)
+REQUIRED_FIELDS = frozenset(step.field for step in SURVEY.steps[:-1])
+
+@router.message(StateFilter(*SURVEY.states[:-1]))
+async def process_step(message: Message, state: FSMContext, t, raw_state: str):
+    """Обработка ответа на шаг опроса (все шаги, кроме комментария)"""
+    step = SURVEY.by_state[raw_state]
+    
+    try:
+        value = SURVEY.parse(step, message.text)
+    except SurveyError as e:
+        await message.answer(t(e.args[0], **PROMPT_CONSTANTS), reply_markup=back_kb(t))
+        return
+    
+    next_step = SURVEY.next[raw_state]
+    data = await advance(state, next_step.state, **{step.field: value})
     
     await message.answer(
-        text=f"{progress_bar(2)}\n\n{t('destination_saved', destination=message.text)}",
-        reply_markup=back_kb(t)
+        text=SURVEY.render(next_step, t, data),
+        reply_markup=next_step.keyboard(t)
     )
-    await state.set_state(SurveyStates.departure_date)
 
-@router.message(SurveyStates.departure_date)
-async def process_date(message: Message, state: FSMContext, t):
-    """Обработка даты вылета"""
-    try:
-        date_obj = datetime.strptime(message.text.strip(), '%d.%m.%Y')
-        
-        if date_obj < datetime.now():
-            await message.answer(t('date_past'), reply_markup=back_kb(t))
-            return
-        
-        await state.update_data(departure_date=message.text.strip())
-        
-        await message.answer(
-            text=f"{progress_bar(3)}\n\n{t('date_saved', date=message.text)}",
-            reply_markup=back_kb(t)
-        )
-        await state.set_state(SurveyStates.nights)
-        
-    except ValueError:
-        await message.answer(t('date_invalid'), reply_markup=back_kb(t))
-
-@router.message(SurveyStates.nights)
-async def process_nights(message: Message, state: FSMContext, t):
-    """Обработка количества ночей"""
-    try:
-        nights = int(message.text.strip())
-        
-        if not (3 <= nights <= 21):
-            await message.answer(t('nights_invalid'), reply_markup=back_kb(t))
-            return
-        
-        await state.update_data(nights=nights)
-        
-        await message.answer(
-            text=f"{progress_bar(4)}\n\n{t('nights_saved', nights=nights)}",
-            reply_markup=back_kb(t)
-        )
-        await state.set_state(SurveyStates.adults)
-        
-    except ValueError:
-        await message.answer(t('nights_invalid'), reply_markup=back_kb(t))
-
-@router.message(SurveyStates.adults)
-async def process_adults(message: Message, state: FSMContext, t):
-    """Обработка взрослых"""
-    try:
-        adults = int(message.text.strip())
-        
-        if not (1 <= adults <= settings.MAX_TRAVELERS):
-            await message.answer(t('adults_invalid'), reply_markup=back_kb(t))
-            return
-        
-        await state.update_data(adults=adults)
-        
-        await message.answer(
-            text=f"{progress_bar(5)}\n\n{t('adults_saved', adults=adults)}",
-            reply_markup=back_kb(t)
-        )
-        await state.set_state(SurveyStates.children)
-        
-    except ValueError:
-        await message.answer(t('adults_invalid'), reply_markup=back_kb(t))
-
-@router.message(SurveyStates.children)
-async def process_children(message: Message, state: FSMContext, t):
-    """Обработка детей"""
-    try:
-        children = int(message.text.strip())
-        
-        if not (0 <= children <= 10):
-            await message.answer(t('children_invalid'), reply_markup=back_kb(t))
-            return
-        
-        await state.update_data(children=children)
-        
-        await message.answer(
-            text=f"{progress_bar(6)}\n\n{t('children_saved', children=children)}",
-            reply_markup=back_kb(t)
-        )
-        await state.set_state(SurveyStates.budget)
-        
-    except ValueError:
-        await message.answer(t('children_invalid'), reply_markup=back_kb(t))
-
-@router.message(SurveyStates.budget)
-async def process_budget(message: Message, state: FSMContext, t, session: AsyncSession):
-    """Обработка бюджета"""
-    try:
-        budget = int(message.text.strip().replace(' ', '').replace('₽', ''))
-        
-        if budget < settings.MIN_BUDGET:
-            await message.answer(
-                t('budget_invalid', min_budget=settings.MIN_BUDGET),
-                reply_markup=back_kb(t)
-            )
-            return
-        
-        await state.update_data(budget=budget)
-        
-        await message.answer(
-            text=f"{progress_bar(7)}\n\n{t('budget_saved', budget=budget)}",
-            reply_markup=skip_kb(t)
-        )
-        await state.set_state(SurveyStates.comment)
-        
-    except ValueError:
-        await message.answer(
-            t('budget_invalid', min_budget=settings.MIN_BUDGET),
-            reply_markup=back_kb(t)
-        )
-
-@router.message(SurveyStates.comment)
-@router.callback_query(F.data == 'skip', SurveyStates.comment)
-async def process_comment(event: Message | CallbackQuery, state: FSMContext, t, session: AsyncSession):
+@router.message(SURVEY.last.state)
+@router.callback_query(F.data == 'skip', SURVEY.last.state)
+async def process_comment(
+    event: Message | CallbackQuery,
+    state: FSMContext,
+    t,
+    session: AsyncSession,
+    event_update: Update
+):
     """Обработка комментария и завершение опроса"""
     
     # Получение комментария
     if isinstance(event, Message):
-        comment = event.text.strip()
+        comment = (event.text or '').strip()
         user = event.from_user
         message = event
     else:
@@ -152,11 +62,27 @@ async def process_comment(event: Message | CallbackQuery, state: FSMContext, t,
         message = event.message
         await event.answer()
     
-    await state.update_data(comment=comment)
-    
     # Получение всех данных
     data = await state.get_data()
     
+    # Данные опроса уже сброшены (повтор после сохранения заявки)
+    if not REQUIRED_FIELDS <= data.keys():
+        request_id = recent_submissions.last_for_user(user.id)
+        if request_id is not None:
+            await answer_duplicate(message, state, t, request_id)
+        else:
+            await finish(state)
+            await message.answer(text=t('welcome'), reply_markup=main_menu_kb(t))
+        return
+    
+    key = submission_key(data, user.id, event_update.update_id)
+    
+    # Повторная отправка того же опроса - без записи в БД, Sheets и уведомления
+    request_id = recent_submissions.get(key)
+    if request_id is not None:
+        await answer_duplicate(message, state, t, request_id)
+        return
+    
     # Сохранение в БД
     new_request = Request(
         user_id=user.id,
@@ -167,26 +93,32 @@ async def process_comment(event: Message | CallbackQuery, state: FSMContext, t,
         adults=data['adults'],
         children=data['children'],
         budget=data['budget'],
-        comment=comment
+        comment=comment,
+        submission_key=key
     )
     
     session.add(new_request)
-    await session.commit()
-    await session.refresh(new_request)
-    
-    # Сохранение в Google Sheets (асинхронно в фоне)
     try:
-        await save_to_sheets(new_request)
-    except Exception as e:
-        print(f"Ошибка сохранения в Google Sheets: {e}")
+        await session.flush()
+    except IntegrityError:
+        # Опрос уже сохранён (другим процессом или до перезапуска)
+        await session.rollback()
+        request_id = await find_submission(session, key)
+        if request_id is None:
+            raise
+        recent_submissions.add(key, request_id, user.id)
+        await answer_duplicate(message, state, t, request_id)
+        return
     
-    # Уведомление админа
-    try:
-        await notify_admin(new_request, message.bot)
-    except Exception as e:
-        print(f"Ошибка отправки уведомления админу: {e}")
+    # Выгрузка в Google Sheets через outbox (тем же commit, что и заявка)
+    add_to_outbox(session, new_request)
+    with span('db.commit'):
+        await session.commit()
+    recent_submissions.add(key, new_request.id, user.id)
+    sheets_outbox.wake()
+    stats_cache.invalidate()
     
-    # Отправка подтверждения пользователю
+    # Отправка подтверждения пользователю (сразу после commit)
     await message.answer(
         text=t('survey_complete',
                request_id=new_request.id,
@@ -200,57 +132,38 @@ async def process_comment(event: Message | CallbackQuery, state: FSMContext, t,
         reply_markup=main_menu_kb(t)
     )
     
-    await state.clear()
+    await finish(state)
+    
+    # Уведомление админа в фоне
+    side_effects.spawn(notify_admin(new_request, message.bot), name='notify_admin')
+
+async def answer_duplicate(message: Message, state: FSMContext, t, request_id: int):
+    """Ответ на повторную отправку уже сохранённого опроса"""
+    await message.answer(
+        text=t('survey_duplicate', request_id=request_id),
+        reply_markup=main_menu_kb(t)
+    )
+    await finish(state)
 
 @router.callback_query(F.data == 'back')
-async def handle_back(callback: CallbackQuery, state: FSMContext, t):
+async def handle_back(callback: CallbackQuery, state: FSMContext, t, raw_state: str | None = None):
     """Обработка кнопки 'Назад'"""
-    current_state = await state.get_state()
-    
-    # Маппинг состояний для возврата
-    state_map = {
-        SurveyStates.destination: None,
-        SurveyStates.departure_date: SurveyStates.destination,
-        SurveyStates.nights: SurveyStates.departure_date,
-        SurveyStates.adults: SurveyStates.nights,
-        SurveyStates.children: SurveyStates.adults,
-        SurveyStates.budget: SurveyStates.children,
-        SurveyStates.comment: SurveyStates.budget
-    }
+    prev_step = SURVEY.prev.get(raw_state)
     
-    # Получение предыдущего состояния
-    prev_state = None
-    for s, prev in state_map.items():
-        if current_state == s.state:
-            prev_state = prev
-            break
-    
-    if prev_state is None:
+    if prev_step is None:
         # Возврат в главное меню
         await callback.message.edit_text(
             text=t('welcome'),
             reply_markup=main_menu_kb(t)
         )
-        await state.clear()
+        await finish(state)
     else:
-        await state.set_state(prev_state)
-        
         # Показ сообщения для предыдущего шага
-        data = await state.get_data()
+        data = await advance(state, prev_step.state)
         
-        if prev_state == SurveyStates.destination:
-            text = f"{progress_bar(1)}\n\n{t('start_survey')}"
-        elif prev_state == SurveyStates.departure_date:
-            text = f"{progress_bar(2)}\n\n{t('destination_saved', destination=data.get('destination', ''))}"
-        elif prev_state == SurveyStates.nights:
-            text = f"{progress_bar(3)}\n\n{t('date_saved', date=data.get('departure_date', ''))}"
-        elif prev_state == SurveyStates.adults:
-            text = f"{progress_bar(4)}\n\n{t('nights_saved', nights=data.get('nights', 0))}"
-        elif prev_state == SurveyStates.children:
-            text = f"{progress_bar(5)}\n\n{t('adults_saved', adults=data.get('adults', 0))}"
-        elif prev_state == SurveyStates.budget:
-            text = f"{progress_bar(6)}\n\n{t('children_saved', children=data.get('children', 0))}"
-        
-        await callback.message.edit_text(text=text, reply_markup=back_kb(t))
+        await callback.message.edit_text(
+            text=SURVEY.render(prev_step, t, data),
+            reply_markup=prev_step.keyboard(t)
+        )
     
     await callback.answer()
@@ -1,2 +1,2 @@
-from .inline import get_progress_bar, main_menu, navigation_keyboard, confirmation_keyboard
-__all__ = ['get_progress_bar', 'main_menu', 'navigation_keyboard', 'confirmation_keyboard']
+from .inline import progress_bar, main_menu_kb, back_kb, skip_kb
+__all__ = ['progress_bar', 'main_menu_kb', 'back_kb', 'skip_kb']
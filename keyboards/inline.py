@@ -1,17 +1,50 @@
+from typing import Callable, Dict, Tuple
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
+# Готовые клавиатуры: (имя, язык, версия каталога) -> разметка.
+# Объекты общие для всех сообщений, изменять их нельзя.
+_markups: Dict[Tuple[str, str, int], InlineKeyboardMarkup] = {}
+
+
+def _cached(build: Callable) -> Callable:
+    """Строит клавиатуру один раз на язык
+
+    Ключ - t.lang и t.version переводчика из I18nMiddleware, поэтому
+    после перезагрузки локалей клавиатуры собираются заново. Для
+    переводчиков без этих атрибутов кэш не используется.
+    """
+    name = build.__name__
+
+    def wrapper(t) -> InlineKeyboardMarkup:
+        lang = getattr(t, 'lang', None)
+        if lang is None:
+            return build(t)
+        key = (name, lang, t.version)
+        markup = _markups.get(key)
+        if markup is None:
+            markup = _markups[key] = build(t)
+        return markup
+
+    wrapper.__name__ = name
+    wrapper.__doc__ = build.__doc__
+    return wrapper
+
+
+@_cached
 def main_menu_kb(t) -> InlineKeyboardMarkup:
     """Главное меню"""
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text=t('find_tour'), callback_data='start_survey')]
     ])
 
+@_cached
 def back_kb(t) -> InlineKeyboardMarkup:
     """Кнопка назад"""
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text=t('back'), callback_data='back')]
     ])
 
+@_cached
 def skip_kb(t) -> InlineKeyboardMarkup:
     """Кнопка пропустить"""
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -19,9 +52,20 @@ def skip_kb(t) -> InlineKeyboardMarkup:
         [InlineKeyboardButton(text=t('back'), callback_data='back')]
     ])
 
-def progress_bar(current: int, total: int = 7) -> str:
-    """Цветной прогресс-бар с эмодзи"""
+def _build_progress_bar(current: int, total: int) -> str:
     emoji_list = ['🔴', '🟠', '🟡', '🟢', '🔵', '🟣', '⚫']
     filled = emoji_list[current - 1] if current <= len(emoji_list) else '🟢'
     bar = ''.join([filled if i < current else '⚪' for i in range(1, total + 1)])
     return f"{bar} {current}/{total}"
+
+# Прогресс-бары для опроса из 7 шагов, посчитанные заранее
+PROGRESS_BARS: Dict[Tuple[int, int], str] = {
+    (current, 7): _build_progress_bar(current, 7) for current in range(1, 8)
+}
+
+def progress_bar(current: int, total: int = 7) -> str:
+    """Цветной прогресс-бар с эмодзи"""
+    bar = PROGRESS_BARS.get((current, total))
+    if bar is None:
+        bar = PROGRESS_BARS[(current, total)] = _build_progress_bar(current, total)
+    return bar
@@ -1,2 +0,0 @@
-from . import ru, en
-__all__ = ['ru', 'en']
@@ -1,63 +1,342 @@
 import asyncio
+import json
 import logging
+import secrets
+import signal
+from aiohttp import web
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
+from aiogram.fsm.storage.base import BaseStorage
 from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
 
 from config.settings import settings
 from database.database import init_db, async_session_maker
-from middlewares.i18n import I18nMiddleware
+from database.fsm_storage import DatabaseStorage
+from middlewares.database import DatabaseSessionMiddleware
+from middlewares.i18n import I18nMiddleware, catalog
+from middlewares.metrics import HandlerMetricsMiddleware, TelegramMetricsMiddleware, UpdateMetricsMiddleware
+from middlewares.scheduler import SchedulerMiddleware
 from middlewares.throttling import ThrottlingMiddleware
-from handlers import start, survey
+from middlewares.tracing import SpanMiddleware, TracingMiddleware
+from middlewares.users import UserTrackingMiddleware
+from handlers import admin, start, survey
+from services.google_sheets import sheets_client, sheets_writer
+from services.sheets_outbox import sheets_outbox
+from services.background import side_effects
+from services.broadcast import broadcast_worker
+from services.users import user_tracker
+from services.sharding import ShardPool, poll_raw_updates, serve_shard
+from services.metrics import start_metrics_server
+from services.tracing import install_log_filter, tracer
 
 # Настройка логирования (только stdout для хостинга)
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    format='%(asctime)s - %(name)s - %(levelname)s - [%(correlation_id)s] %(message)s'
 )
+# correlation_id - апдейт, при обработке которого сделана запись
+install_log_filter()
 
 logger = logging.getLogger(__name__)
 
-async def main():
-    """Главная функция запуска бота"""
-    
-    # Инициализация базы данных
-    await init_db()
-    logger.info("База данных инициализирована")
-    
-    # Инициализация бота и диспетчера
+def create_bot() -> Bot:
     bot = Bot(
         token=settings.TELEGRAM_TOKEN,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
+    if settings.METRICS_ENABLED or settings.TRACE_SAMPLE_RATE > 0:
+        bot.session.middleware(TelegramMetricsMiddleware())
+    return bot
+
+def create_storage() -> BaseStorage:
+    # Состояния опросов переживают перезапуск бота
+    if settings.FSM_STORAGE == 'database':
+        return DatabaseStorage(async_session_maker)
+    return MemoryStorage()
+
+def build_dispatcher(storage: BaseStorage, primary: bool = True, metrics_port: int | None = None) -> Dispatcher:
+    """Диспетчер с middleware, роутерами и фоновыми задачами
     
-    storage = MemoryStorage()
-    dp = Dispatcher(storage=storage)
+    Один и тот же для поллинга, вебхука и рабочих процессов: фоновые
+    задачи запускаются в dp.startup и останавливаются в dp.shutdown.
+    Рассылки и outbox Google Sheets работают только в основном
+    процессе (primary), чтобы не выполняться дважды. Если задан
+    metrics_port, на нём поднимается сервер с /metrics.
+    """
+    # FSMContextMiddleware подключается ниже, после планировщика
+    dp = Dispatcher(storage=storage, disable_fsm=True)
     
     # Регистрация middleware
-    dp.message.middleware(I18nMiddleware())
-    dp.callback_query.middleware(I18nMiddleware())
-    dp.message.middleware(ThrottlingMiddleware())
+    dp.update.outer_middleware(TracingMiddleware())
+    if settings.TRACE_SAMPLE_RATE > 0:
+        middleware_span = SpanMiddleware('middleware')
+        dp.message.middleware(middleware_span)
+        dp.callback_query.middleware(middleware_span)
+    if settings.METRICS_ENABLED:
+        dp.update.outer_middleware(UpdateMetricsMiddleware())
+    # Апдейты одного пользователя - по очереди, всего - не более SCHEDULER_MAX_INFLIGHT
+    scheduler = SchedulerMiddleware()
+    dp.update.outer_middleware(scheduler)
+    # Состояние читается уже в очереди пользователя: апдейт видит результат
+    # предыдущего, а медленное чтение из БД не меняет порядок апдейтов
+    dp.update.outer_middleware(dp.fsm)
+    dp.update.outer_middleware(UserTrackingMiddleware())
+    i18n = I18nMiddleware()
+    dp.message.middleware(i18n)
+    dp.callback_query.middleware(i18n)
+    throttling = ThrottlingMiddleware()
+    dp.message.middleware(throttling)
+    dp.callback_query.middleware(throttling)
     
-    # Middleware для внедрения сессии БД
-    @dp.update.middleware()
-    async def db_session_middleware(handler, event, data):
-        async with async_session_maker() as session:
-            data['session'] = session
-            return await handler(event, data)
+    # Middleware для внедрения сессии БД (открывается только при обращении)
+    db_session = DatabaseSessionMiddleware(async_session_maker)
+    dp.update.middleware(db_session)
+    
+    # Время работы хендлеров (последним, чтобы не учитывать другие middleware)
+    if settings.METRICS_ENABLED:
+        handler_metrics = HandlerMetricsMiddleware()
+        dp.message.middleware(handler_metrics)
+        dp.callback_query.middleware(handler_metrics)
+    if settings.TRACE_SAMPLE_RATE > 0:
+        handler_span = SpanMiddleware('handler', with_handler=True)
+        dp.message.middleware(handler_span)
+        dp.callback_query.middleware(handler_span)
     
     # Регистрация роутеров
     dp.include_router(start.router)
+    # Команды админа раньше опроса, чтобы работали и посреди него
+    dp.include_router(admin.router)
     dp.include_router(survey.router)
     
-    logger.info("Бот запущен")
+    tasks = []
+    runners = []
+    
+    async def on_startup(bot: Bot):
+        # Фоновая пакетная запись в Google Sheets и разбор outbox
+        sheets_writer.start()
+        if primary:
+            sheets_outbox.start()
+        # Отложенная запись пользователей
+        user_tracker.start()
+        # Продолжение незавершённых рассылок
+        if primary:
+            broadcast_worker.start(bot)
+        if settings.I18N_WATCH:
+            tasks.append(asyncio.create_task(catalog.watch(settings.I18N_WATCH_INTERVAL)))
+        if metrics_port is not None:
+            runners.append(await start_metrics_server(settings.METRICS_HOST, metrics_port))
+    
+    async def on_shutdown():
+        for task in tasks:
+            task.cancel()
+        for runner in runners:
+            await runner.cleanup()
+        await broadcast_worker.stop()
+        await side_effects.drain()
+        await storage.close()
+        await sheets_outbox.stop()
+        await sheets_writer.stop()
+        sheets_client.close()
+        await user_tracker.stop()
+        await throttling.storage.close()
+        logger.info(f"Сессий БД открыто: {db_session.stats['sessions']} на {db_session.stats['updates']} апдейтов")
+        logger.info(
+            f"Планировщик: {scheduler.stats}, ожидание p50={scheduler.wait_percentile(50):.3f}с "
+            f"p99={scheduler.wait_percentile(99):.3f}с"
+        )
+        if tracer.stats['traced']:
+            logger.info(f"Трассировка: {tracer.stats}")
+    
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
+    return dp
+
+async def wait_for_signal():
+    """Ожидание SIGTERM (остановка контейнера) или Ctrl+C"""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+async def run_polling(dp: Dispatcher, bot: Bot):
+    """Получение апдейтов long polling"""
+    # Поллинг не работает, пока установлен вебхук
+    await bot.delete_webhook()
+    await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+
+class WebhookHandler(SimpleRequestHandler):
+    """Обработчик вебхука, при остановке дожидающийся принятых апдейтов"""
+
+    closing = False
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if self.closing:
+            # Telegram повторит апдейт позже (другой реплике или после перезапуска)
+            return web.Response(status=503, text='Shutting down')
+        return await super().handle(request)
+
+    async def drain(self, timeout: float = settings.WEBHOOK_DRAIN_TIMEOUT):
+        """Отказ в новых апдейтах и ожидание тех, что ещё обрабатываются в фоне"""
+        self.closing = True
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while self._background_feed_update_tasks:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                logger.warning(f"Не дождались апдейтов вебхука: {len(self._background_feed_update_tasks)}")
+                return
+            logger.info(f"Ожидание апдейтов вебхука: {len(self._background_feed_update_tasks)}")
+            await asyncio.wait(set(self._background_feed_update_tasks), timeout=remaining)
+
+def build_webhook_app(dp: Dispatcher, bot: Bot) -> tuple[web.Application, WebhookHandler]:
+    """aiohttp-приложение с обработчиком вебхука на WEBHOOK_PATH
+    
+    Telegram сразу получает 200, а апдейт обрабатывается в фоне.
+    Запросы без правильного X-Telegram-Bot-Api-Secret-Token отклоняются.
+    """
+    app = web.Application()
+    handler = WebhookHandler(
+        dispatcher=dp,
+        bot=bot,
+        handle_in_background=True,
+        secret_token=settings.WEBHOOK_SECRET
+    )
+    handler.register(app, path=settings.WEBHOOK_PATH)
+    return app, handler
+
+async def run_webhook(dp: Dispatcher, bot: Bot):
+    """Приём апдейтов вебхуком через встроенный aiohttp-сервер
+    
+    При остановке сервер сначала перестаёт принимать запросы, затем
+    дожидается уже принятых апдейтов и только потом останавливает
+    диспетчер (хранилище FSM, outbox) и закрывает сессию бота.
+    """
+    app, handler = build_webhook_app(dp, bot)
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+    
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=settings.WEBAPP_HOST, port=settings.WEBAPP_PORT)
+    await site.start()
+    logger.info(f"Вебхук слушает {settings.WEBAPP_HOST}:{settings.WEBAPP_PORT}{settings.WEBHOOK_PATH}")
+    
+    try:
+        await set_webhook(bot, dp)
+        await wait_for_signal()
+    finally:
+        await site.stop()
+        await handler.drain()
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
+        # Закрывает и сессию бота (WebhookHandler.close)
+        await runner.cleanup()
+
+async def set_webhook(bot: Bot, dp: Dispatcher):
+    if settings.WEBHOOK_URL:
+        await bot.set_webhook(
+            url=settings.WEBHOOK_URL.rstrip('/') + settings.WEBHOOK_PATH,
+            secret_token=settings.WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types()
+        )
+
+def run_shard(index: int, updates):
+    """Точка входа рабочего процесса (SHARD_WORKERS > 0)"""
+    # Ctrl+C получает вся группа процессов, а остановкой управляет маршрутизатор
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(shard_main(index, updates))
+
+async def shard_main(index: int, updates):
+    bot = create_bot()
+    metrics_port = settings.METRICS_PORT + index if settings.METRICS_ENABLED else None
+    dp = build_dispatcher(create_storage(), primary=index == 0, metrics_port=metrics_port)
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+    logger.info(f"Рабочий процесс shard-{index} запущен")
+    try:
+        await serve_shard(updates, lambda update: dp.feed_raw_update(bot, update))
+    finally:
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
+        await bot.session.close()
+
+async def run_router(dp: Dispatcher, bot: Bot):
+    """Приём апдейтов и распределение по рабочим процессам
+    
+    Маршрутизатор только читает id отправителя из JSON апдейта,
+    разбор и обработка выполняются в рабочих процессах.
+    """
+    pool = ShardPool(run_shard)
+    pool.start()
     
-    # Запуск поллинга
     try:
-        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+        if settings.RUN_MODE == 'webhook':
+            async def handle(request: web.Request) -> web.Response:
+                token = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+                if not secrets.compare_digest(token, settings.WEBHOOK_SECRET):
+                    return web.Response(status=401, text='Unauthorized')
+                raw = await request.text()
+                await pool.route(json.loads(raw), raw)
+                return web.Response()
+            
+            app = web.Application()
+            app.router.add_post(settings.WEBHOOK_PATH, handle)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            await web.TCPSite(runner, host=settings.WEBAPP_HOST, port=settings.WEBAPP_PORT).start()
+            await set_webhook(bot, dp)
+            try:
+                await wait_for_signal()
+            finally:
+                await runner.cleanup()
+        else:
+            await bot.delete_webhook()
+            poller = asyncio.create_task(poll_raw_updates(
+                settings.TELEGRAM_TOKEN,
+                dp.resolve_used_update_types(),
+                pool.route
+            ))
+            stop = asyncio.create_task(wait_for_signal())
+            try:
+                # Если поллинг упал, процесс завершается с его ошибкой, а не ждёт сигнала вечно
+                await asyncio.wait({poller, stop}, return_when=asyncio.FIRST_COMPLETED)
+                if poller.done():
+                    logger.error("Поллинг апдейтов остановился")
+                    poller.result()
+            finally:
+                poller.cancel()
+                stop.cancel()
     finally:
+        await pool.stop()
         await bot.session.close()
+        logger.info(f"Апдейтов по процессам: {pool.stats['routed']}")
+
+async def main():
+    """Главная функция запуска бота"""
+    
+    # Без секрета кто угодно, узнавший адрес вебхука, сможет подделать апдейты
+    if settings.RUN_MODE == 'webhook' and not settings.WEBHOOK_SECRET:
+        raise RuntimeError("Для RUN_MODE=webhook нужен WEBHOOK_SECRET")
+    
+    # Инициализация базы данных
+    await init_db()
+    logger.info("База данных инициализирована")
+    
+    # Инициализация бота и диспетчера
+    bot = create_bot()
+    # При нескольких процессах /metrics отдают рабочие процессы
+    metrics_port = None
+    if settings.METRICS_ENABLED and settings.SHARD_WORKERS == 0:
+        metrics_port = settings.METRICS_PORT
+    dp = build_dispatcher(create_storage(), metrics_port=metrics_port)
+    
+    logger.info(f"Бот запущен ({settings.RUN_MODE})")
+    
+    if settings.SHARD_WORKERS > 0:
+        await run_router(dp, bot)
+    elif settings.RUN_MODE == 'webhook':
+        await run_webhook(dp, bot)
+    else:
+        await run_polling(dp, bot)
 
 if __name__ == '__main__':
     asyncio.run(main())
@@ -1,4 +1,3 @@
-from .logging import LoggingMiddleware
-from .antiflood import AntiFloodMiddleware
 from .i18n import I18nMiddleware
-__all__ = ['LoggingMiddleware', 'AntiFloodMiddleware', 'I18nMiddleware']
+from .throttling import ThrottlingMiddleware
+__all__ = ['I18nMiddleware', 'ThrottlingMiddleware']
@@ -0,0 +1,67 @@
+from typing import Callable, Dict, Any, Awaitable, Optional
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from database.database import async_session_maker
+
+
+class LazySession:
+    """Сессия БД, которая создаётся при первом обращении
+
+    Хендлеры работают с ней как с обычной AsyncSession, а апдейты,
+    которым БД не нужна (/start, кнопки, отбитые антиспамом сообщения),
+    сессию не открывают вовсе.
+    """
+
+    __slots__ = ('_session_maker', '_session', '_on_open')
+
+    def __init__(self, session_maker: async_sessionmaker, on_open: Callable[[], None]):
+        self._session_maker = session_maker
+        self._session: Optional[AsyncSession] = None
+        self._on_open = on_open
+
+    @property
+    def opened(self) -> bool:
+        return self._session is not None
+
+    def __getattr__(self, name: str) -> Any:
+        if self._session is None:
+            self._session = self._session_maker()
+            self._on_open()
+        return getattr(self._session, name)
+
+    async def close(self):
+        """Закрытие сессии (соединение сразу возвращается в пул)"""
+        if self._session is not None:
+            session, self._session = self._session, None
+            await session.close()
+
+
+class DatabaseSessionMiddleware(BaseMiddleware):
+    """Middleware для внедрения сессии БД (открывается по требованию)"""
+
+    def __init__(self, session_maker: async_sessionmaker = async_session_maker):
+        self.session_maker = session_maker
+        self.stats = {
+            'updates': 0,
+            'sessions': 0,
+        }
+        super().__init__()
+
+    def _opened(self):
+        self.stats['sessions'] += 1
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        self.stats['updates'] += 1
+        session = LazySession(self.session_maker, self._opened)
+        data['session'] = session
+        try:
+            return await handler(event, data)
+        finally:
+            await session.close()
@@ -1,26 +1,147 @@
+import asyncio
 import json
-from typing import Callable, Dict, Any, Awaitable
+import logging
+from pathlib import Path
+from string import Formatter
+from typing import Callable, Dict, Any, Awaitable, Optional
 from aiogram import BaseMiddleware
 from aiogram.types import TelegramObject, User
 
+logger = logging.getLogger(__name__)
+
+LOCALES_DIR = Path(__file__).resolve().parent.parent / 'locales'
+DEFAULT_LANG = 'ru'
+
+
+class Template:
+    """Строка локали, разобранная один раз при загрузке
+
+    Строки без подстановок отдаются как есть (даже если переданы
+    аргументы), для остальных заранее связывается str.format.
+    """
+
+    __slots__ = ('text', '_format')
+
+    def __init__(self, text: str):
+        self.text = text
+        has_fields = any(name is not None for _, name, _, _ in Formatter().parse(text))
+        self._format = text.format if has_fields else None
+
+    def render(self, kwargs: Dict[str, Any]) -> str:
+        if kwargs and self._format is not None:
+            return self._format(**kwargs)
+        return self.text
+
+
+class Translator:
+    """Переводчик для одного языка (один объект на язык, без замыканий на каждый апдейт)"""
+
+    __slots__ = ('lang', 'version', '_templates')
+
+    def __init__(self, lang: str, templates: Dict[str, Template], version: int):
+        self.lang = lang
+        self.version = version
+        self._templates = templates
+
+    def __call__(self, key: str, **kwargs) -> str:
+        template = self._templates.get(key)
+        if template is None:
+            return key
+        return template.render(kwargs)
+
+
+class Catalog:
+    """Общий для процесса каталог переводов
+
+    Файлы locales/*.json читаются один раз. Для каждого языка строки
+    дополняются из базового языка и языка по умолчанию, а язык
+    пользователя ищется по цепочке en-GB -> en -> ru.
+    """
+
+    def __init__(self, path: Path = LOCALES_DIR, default: str = DEFAULT_LANG):
+        self.path = path
+        self.default = default
+        self.version = 0
+        self._mtimes: Dict[Path, float] = {}
+        self._translators: Dict[str, Translator] = {}
+        self._resolved: Dict[Optional[str], Translator] = {}
+
+    def load(self):
+        """Загрузка (или перезагрузка) всех файлов локалей"""
+        raw: Dict[str, Dict[str, str]] = {}
+        mtimes: Dict[Path, float] = {}
+        for file in sorted(self.path.glob('*.json')):
+            with open(file, 'r', encoding='utf-8') as f:
+                raw[file.stem.lower()] = json.load(f)
+            mtimes[file] = file.stat().st_mtime
+
+        version = self.version + 1
+        translators = {}
+        for lang in raw:
+            messages = dict(raw.get(self.default, {}))
+            base = lang.split('-')[0]
+            if base != lang:
+                messages.update(raw.get(base, {}))
+            messages.update(raw[lang])
+            templates = {key: Template(text) for key, text in messages.items()}
+            translators[lang] = Translator(lang, templates, version)
+
+        if self.default not in translators:
+            translators[self.default] = Translator(self.default, {}, version)
+
+        # Подмена целиком, чтобы параллельные апдейты видели согласованный каталог
+        self._translators = translators
+        self._resolved = {}
+        self._mtimes = mtimes
+        self.version = version
+
+    def get(self, language_code: Optional[str]) -> Translator:
+        """Переводчик для языка пользователя"""
+        translator = self._resolved.get(language_code)
+        if translator is not None:
+            return translator
+
+        translator = self._translators[self.default]
+        if language_code:
+            code = language_code.lower().replace('_', '-')
+            for candidate in (code, code.split('-')[0]):
+                if candidate in self._translators:
+                    translator = self._translators[candidate]
+                    break
+
+        self._resolved[language_code] = translator
+        return translator
+
+    def changed(self) -> bool:
+        """Изменились ли файлы локалей с момента загрузки"""
+        files = set(self.path.glob('*.json'))
+        if files != set(self._mtimes):
+            return True
+        return any(file.stat().st_mtime != mtime for file, mtime in self._mtimes.items())
+
+    async def watch(self, interval: float):
+        """Перезагрузка каталога при изменении файлов (без перезапуска бота)"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if self.changed():
+                    self.load()
+                    logger.info("Локали перезагружены")
+            except Exception as e:
+                logger.error(f"Ошибка перезагрузки локалей: {e}")
+
+
+catalog = Catalog()
+catalog.load()
+
+
 class I18nMiddleware(BaseMiddleware):
     """Middleware для мультиязычности"""
-    
-    def __init__(self):
-        self.translations = {
-            'ru': self._load_locale('ru'),
-            'en': self._load_locale('en')
-        }
+
+    def __init__(self, translations: Catalog = catalog):
+        self.catalog = translations
         super().__init__()
-    
-    def _load_locale(self, lang: str) -> dict:
-        """Загрузка файла локали"""
-        try:
-            with open(f'locales/{lang}.json', 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except FileNotFoundError:
-            return {}
-    
+
     async def __call__(
         self,
         handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
@@ -28,19 +149,11 @@ class I18nMiddleware(BaseMiddleware):
         data: Dict[str, Any]
     ) -> Any:
         user: User = data.get('event_from_user')
-        
+
         # Определение языка (русский по умолчанию)
-        lang = 'ru'
-        if user and user.language_code:
-            if user.language_code.startswith('en'):
-                lang = 'en'
-        
-        # Функция перевода
-        def t(key: str, **kwargs) -> str:
-            text = self.translations.get(lang, {}).get(key, key)
-            return text.format(**kwargs) if kwargs else text
-        
+        t = self.catalog.get(user.language_code if user else None)
+
         data['t'] = t
-        data['lang'] = lang
-        
+        data['lang'] = t.lang
+
         return await handler(event, data)
@@ -0,0 +1,71 @@
+import time
+from typing import Callable, Dict, Any, Awaitable
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import TelegramObject, Update
+
+from services.metrics import handler_seconds, telegram_call_seconds, updates_total
+from services.tracing import record
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Счётчик апдейтов по типу и результату (handled, unhandled, error)"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        event_type = event.event_type if isinstance(event, Update) else type(event).__name__
+        try:
+            result = await handler(event, data)
+        except Exception:
+            updates_total.inc(event_type, 'error')
+            raise
+        updates_total.inc(event_type, 'unhandled' if result is UNHANDLED else 'handled')
+        return result
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Гистограмма времени работы хендлеров (по имени функции)"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        handler_object = data.get('handler')
+        name = getattr(getattr(handler_object, 'callback', None), '__name__', 'unknown')
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            handler_seconds.observe(time.perf_counter() - started, name)
+
+
+class TelegramMetricsMiddleware(BaseRequestMiddleware):
+    """Время вызовов Telegram API (middleware сессии бота, метрики и спаны)"""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot,
+        method: TelegramMethod[TelegramType]
+    ):
+        started = time.perf_counter()
+        outcome = 'ok'
+        try:
+            return await make_request(bot, method)
+        except Exception:
+            outcome = 'error'
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            name = type(method).__name__
+            telegram_call_seconds.observe(duration, name, outcome)
+            record(f'telegram.{name}', started, duration)
@@ -0,0 +1,168 @@
+import asyncio
+import time
+from collections import deque
+from typing import Callable, Dict, Any, Awaitable, Deque
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, User
+
+from config.settings import settings
+from services.tracing import record
+
+
+class PrioritySemaphore:
+    """Семафор, который при освобождении места первыми будит приоритетных"""
+
+    def __init__(self, value: int):
+        self.value = value
+        self._waiters: Dict[bool, Deque[asyncio.Future]] = {True: deque(), False: deque()}
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters[True]) + len(self._waiters[False])
+
+    async def acquire(self, priority: bool = False):
+        if self.value > 0 and not self.waiting:
+            self.value -= 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[priority].append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Место уже передано нам - отдаём следующему
+                self.release()
+            else:
+                self._waiters[priority].remove(future)
+            raise
+
+    def release(self):
+        for priority in (True, False):
+            waiters = self._waiters[priority]
+            while waiters:
+                future = waiters.popleft()
+                if not future.done():
+                    future.set_result(None)
+                    return
+        self.value += 1
+
+
+class _Lane:
+    """Очередь апдейтов одного пользователя"""
+    __slots__ = ('pending', 'running')
+
+    def __init__(self):
+        self.pending: Deque[asyncio.Future] = deque()
+        self.running = False
+
+
+class SchedulerMiddleware(BaseMiddleware):
+    """Планировщик апдейтов
+
+    Апдейты одного пользователя обрабатываются строго по очереди
+    (двойное нажатие «Пропустить» не создаст две заявки), в очереди
+    ждут не более queue_size апдейтов - при переполнении отбрасывается
+    самый старый. Одновременно выполняется не более max_inflight
+    хендлеров, апдейты админа получают свободное место первыми.
+
+    Должен стоять до FSMContextMiddleware: порядок в очереди - порядок
+    поступления, а состояние FSM читается уже после своей очереди.
+    """
+
+    def __init__(
+        self,
+        max_inflight: int = settings.SCHEDULER_MAX_INFLIGHT,
+        queue_size: int = settings.SCHEDULER_USER_QUEUE,
+        admin_id: int = settings.ADMIN_CHAT_ID
+    ):
+        self.queue_size = queue_size
+        self.admin_id = admin_id
+        self.slots = PrioritySemaphore(max_inflight)
+        self._lanes: Dict[int, _Lane] = {}
+        # Время ожидания до запуска хендлера (сек.) по последним апдейтам
+        self.waits: Deque[float] = deque(maxlen=1000)
+        self.stats = {
+            'handled': 0,
+            'queued': 0,
+            'dropped': 0,
+        }
+        super().__init__()
+
+    def wait_percentile(self, percent: float) -> float:
+        """Перцентиль времени ожидания в очереди (сек.)"""
+        if not self.waits:
+            return 0.0
+        ordered = sorted(self.waits)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user: User = data.get('event_from_user')
+        started = time.monotonic()
+
+        if user is None:
+            return await self._run(handler, event, data, False, started)
+
+        lane = self._lanes.get(user.id)
+        if lane is None:
+            lane = self._lanes[user.id] = _Lane()
+
+        queued = lane.running
+        if queued:
+            if not await self._wait_turn(user.id, lane):
+                return None
+        else:
+            lane.running = True
+
+        try:
+            return await self._run(handler, event, data, user.id == self.admin_id, started)
+        finally:
+            self._next(user.id, lane)
+
+    async def _wait_turn(self, user_id: int, lane: _Lane) -> bool:
+        """Ожидание своей очереди; False - апдейт вытеснен более новым"""
+        if len(lane.pending) >= self.queue_size:
+            dropped = lane.pending.popleft()
+            if not dropped.done():
+                dropped.set_result(False)
+            self.stats['dropped'] += 1
+
+        future = asyncio.get_running_loop().create_future()
+        lane.pending.append(future)
+        self.stats['queued'] += 1
+        try:
+            return await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled() and future.result():
+                # Очередь уже передана нам - передаём дальше
+                self._next(user_id, lane)
+                raise
+            if future in lane.pending:
+                lane.pending.remove(future)
+            raise
+
+    def _next(self, user_id: int, lane: _Lane):
+        """Передача очереди следующему апдейту пользователя"""
+        while lane.pending:
+            future = lane.pending.popleft()
+            if not future.done():
+                future.set_result(True)
+                return
+        lane.running = False
+        self._lanes.pop(user_id, None)
+
+    async def _run(self, handler, event, data, priority: bool, started: float) -> Any:
+        await self.slots.acquire(priority)
+        waited = time.monotonic() - started
+        self.waits.append(waited)
+        record('scheduler.wait', time.perf_counter() - waited, waited)
+        try:
+            self.stats['handled'] += 1
+            return await handler(event, data)
+        finally:
+            self.slots.release()
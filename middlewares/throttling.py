@@ -1,36 +1,218 @@
+import logging
 import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
 from typing import Callable, Dict, Any, Awaitable
 from aiogram import BaseMiddleware
-from aiogram.types import Message
+from aiogram.types import Message, CallbackQuery, TelegramObject
 from config.settings import settings
+from services.metrics import throttle_errors_total, throttled_total
+
+logger = logging.getLogger(__name__)
+
+class RateLimitStorage(ABC):
+    """Хранилище состояния антиспама
+
+    hit() атомарно списывает токен из «корзины» пользователя (burst
+    токенов, пополнение 1 токен за rate_period секунд) и возвращает 0,
+    если запрос разрешён, иначе сколько секунд ждать.
+    """
+
+    @abstractmethod
+    async def hit(self, user_id: int, rate_period: float, burst: int) -> float:
+        ...
+
+    @property
+    def size(self) -> int | None:
+        """Число отслеживаемых пользователей (если известно)"""
+        return None
+
+    async def close(self):
+        pass
+
+
+class MemoryRateLimitStorage(RateLimitStorage):
+    """Состояние антиспама в памяти процесса
+
+    Неактивные пользователи удаляются через ttl секунд, а размер таблицы
+    ограничен max_size (удаляются давно не писавшие).
+    """
+
+    def __init__(
+        self,
+        ttl: float = settings.THROTTLE_TTL,
+        max_size: int = settings.THROTTLE_MAX_USERS
+    ):
+        self.ttl = ttl
+        self.max_size = max_size
+        # user_id -> (токены, время последнего обновления)
+        self.buckets: OrderedDict[int, tuple[float, float]] = OrderedDict()
+
+    @property
+    def size(self) -> int:
+        return len(self.buckets)
+
+    async def hit(self, user_id: int, rate_period: float, burst: int) -> float:
+        now = time.monotonic()
+        tokens, updated = self.buckets.pop(user_id, (burst, now))
+        tokens = min(burst, tokens + (now - updated) / rate_period)
+
+        if tokens >= 1:
+            wait_time = 0.0
+            tokens -= 1
+        else:
+            wait_time = (1 - tokens) * rate_period
+
+        self.buckets[user_id] = (tokens, now)
+        self._evict(now)
+        return wait_time
+
+    def _evict(self, now: float):
+        """Удаление неактивных пользователей из начала таблицы"""
+        while self.buckets:
+            user_id, (_, updated) = next(iter(self.buckets.items()))
+            if now - updated < self.ttl and len(self.buckets) <= self.max_size:
+                break
+            del self.buckets[user_id]
+
+
+# Та же корзина токенов, но атомарно на стороне Redis.
+# Время берётся с сервера, чтобы часы реплик бота не влияли на результат.
+TOKEN_BUCKET_LUA = """
+local period = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local ttl = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + (now - updated) / period)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) * period
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.floor(ttl * 1000))
+return tostring(wait)
+"""
+
+
+class RedisRateLimitStorage(RateLimitStorage):
+    """Общее состояние антиспама для нескольких реплик бота
+
+    Работает с любым сервером по протоколу Redis. Каждая проверка -
+    один EVALSHA со скриптом TOKEN_BUCKET_LUA, то есть один запрос
+    к серверу; ключи сами истекают через ttl секунд. Вместо url можно
+    передать готовый клиент (например, fakeredis в тестах).
+    """
+
+    def __init__(
+        self,
+        url: str = settings.REDIS_URL,
+        ttl: float = settings.THROTTLE_TTL,
+        prefix: str = 'throttle',
+        timeout: float = settings.REDIS_TIMEOUT,
+        client=None
+    ):
+        if client is None:
+            try:
+                from redis.asyncio import Redis
+            except ImportError as e:
+                raise RuntimeError("Для THROTTLE_STORAGE=redis нужен пакет redis") from e
+            client = Redis.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout)
+
+        self.redis = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self._script = self.redis.register_script(TOKEN_BUCKET_LUA)
+
+    async def hit(self, user_id: int, rate_period: float, burst: int) -> float:
+        wait_time = await self._script(
+            keys=[f"{self.prefix}:{user_id}"],
+            args=[rate_period, burst, self.ttl]
+        )
+        return float(wait_time)
+
+    async def close(self):
+        await self.redis.aclose()
+
+
+def create_rate_limit_storage(backend: str = settings.THROTTLE_STORAGE) -> RateLimitStorage:
+    """Хранилище антиспама по настройке THROTTLE_STORAGE"""
+    if backend == 'redis':
+        return RedisRateLimitStorage()
+    return MemoryRateLimitStorage()
+
 
 class ThrottlingMiddleware(BaseMiddleware):
-    """Middleware для защиты от спама"""
-    
-    def __init__(self, throttle_time: float = settings.THROTTLE_TIME):
-        self.throttle_time = throttle_time
-        self.user_timings: Dict[int, float] = {}
+    """Middleware для защиты от спама
+
+    Если хранилище недоступно (Redis упал), апдейты пропускаются без
+    ограничения: ошибка пишется в лог один раз до восстановления
+    и считается в tourbot_throttle_errors_total.
+    """
+
+    def __init__(
+        self,
+        storage: RateLimitStorage | None = None,
+        rate_period: float = settings.THROTTLE_TIME,
+        burst: int = settings.THROTTLE_BURST
+    ):
+        self.storage = storage or create_rate_limit_storage()
+        self.rate_period = rate_period
+        self.burst = burst
+        self.stats = {
+            'allowed': 0,
+            'throttled': 0,
+            'errors': 0,
+        }
+        self._storage_down = False
         super().__init__()
-    
+
+    @property
+    def table_size(self) -> int | None:
+        return self.storage.size
+
+    async def _hit(self, user_id: int) -> float:
+        """Проверка лимита; при ошибке хранилища - 0 (пропустить)"""
+        try:
+            wait_time = await self.storage.hit(user_id, self.rate_period, self.burst)
+        except Exception as e:
+            self.stats['errors'] += 1
+            throttle_errors_total.inc()
+            if not self._storage_down:
+                self._storage_down = True
+                logger.error(f"Хранилище антиспама недоступно, ограничение отключено: {e!r}")
+            return 0.0
+
+        if self._storage_down:
+            self._storage_down = False
+            logger.info("Хранилище антиспама снова доступно")
+        return wait_time
+
     async def __call__(
         self,
-        handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
-        event: Message,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
         data: Dict[str, Any]
     ) -> Any:
-        user_id = event.from_user.id
-        current_time = time.time()
-        
-        # Проверка последнего запроса
-        last_time = self.user_timings.get(user_id, 0)
-        
-        if current_time - last_time < self.throttle_time:
+        user = data.get('event_from_user')
+        if user is None:
+            return await handler(event, data)
+
+        wait_time = await self._hit(user.id)
+
+        if wait_time > 0:
+            self.stats['throttled'] += 1
+            throttled_total.inc()
             t = data.get('t')
-            wait_time = round(self.throttle_time - (current_time - last_time), 1)
-            await event.answer(t('throttle', time=wait_time))
+            text = t('throttle', time=round(wait_time, 1))
+            if isinstance(event, (Message, CallbackQuery)):
+                await event.answer(text)
             return
-        
-        # Обновление времени последнего запроса
-        self.user_timings[user_id] = current_time
-        
+
+        self.stats['allowed'] += 1
         return await handler(event, data)
@@ -0,0 +1,50 @@
+from typing import Callable, Dict, Any, Awaitable
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from services.tracing import Tracer, span, tracer
+
+
+class TracingMiddleware(BaseMiddleware):
+    """Correlation id и трассировка апдейта (первый outer middleware)"""
+
+    def __init__(self, update_tracer: Tracer = tracer):
+        self.tracer = update_tracer
+        super().__init__()
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if isinstance(event, Update):
+            state = self.tracer.start(f"u{event.update_id}", event.event_type)
+        else:
+            state = self.tracer.start('-', type(event).__name__)
+        try:
+            return await handler(event, data)
+        finally:
+            self.tracer.finish(state)
+
+
+class SpanMiddleware(BaseMiddleware):
+    """Спан вокруг остальной цепочки; для хендлера к имени добавляется имя функции"""
+
+    def __init__(self, name: str, with_handler: bool = False):
+        self.name = name
+        self.with_handler = with_handler
+        super().__init__()
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        name = self.name
+        if self.with_handler:
+            callback = getattr(data.get('handler'), 'callback', None)
+            name = f"{name}.{getattr(callback, '__name__', 'unknown')}"
+        with span(name):
+            return await handler(event, data)
@@ -0,0 +1,25 @@
+from typing import Callable, Dict, Any, Awaitable
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, User
+
+from services.users import UserTracker, user_tracker
+
+class UserTrackingMiddleware(BaseMiddleware):
+    """Middleware для учёта пользователей бота"""
+    
+    def __init__(self, tracker: UserTracker = user_tracker):
+        self.tracker = tracker
+        super().__init__()
+    
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user: User = data.get('event_from_user')
+        
+        if user and not user.is_bot:
+            self.tracker.touch(user)
+        
+        return await handler(event, data)
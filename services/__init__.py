@@ -1,2 +1,2 @@
-from .google_sheets import send_to_sheets
-__all__ = ['send_to_sheets']
+from .notification import notify_admin
+__all__ = ['notify_admin']
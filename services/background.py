@@ -0,0 +1,56 @@
+import asyncio
+import logging
+from typing import Coroutine
+
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class SideEffectRunner:
+    """Фоновые побочные действия после ответа пользователю
+
+    Задачи выполняются не более max_concurrency одновременно, ошибки
+    логируются, а при остановке бота оставшиеся задачи дожидаются
+    в drain().
+    """
+
+    def __init__(self, max_concurrency: int = settings.SIDE_EFFECT_CONCURRENCY):
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._tasks: set[asyncio.Task] = set()
+
+    @property
+    def pending(self) -> int:
+        return len(self._tasks)
+
+    def spawn(self, coro: Coroutine, name: str) -> asyncio.Task:
+        """Запуск побочного действия в фоне"""
+        task = asyncio.create_task(self._supervise(coro, name), name=name)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _supervise(self, coro: Coroutine, name: str):
+        async with self._semaphore:
+            try:
+                await coro
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception(f"Ошибка фоновой задачи {name}")
+
+    async def drain(self, timeout: float = settings.SIDE_EFFECT_DRAIN_TIMEOUT):
+        """Ожидание оставшихся задач при остановке"""
+        if not self._tasks:
+            return
+
+        logger.info(f"Ожидание фоновых задач: {len(self._tasks)}")
+        _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.warning(f"Отменено незавершённых фоновых задач: {len(pending)}")
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+side_effects = SideEffectRunner()
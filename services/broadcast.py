@@ -0,0 +1,463 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Awaitable, Callable, Iterable
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest, TelegramForbiddenError, TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+)
+from sqlalchemy import insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from config.settings import settings
+from database.database import async_session_maker
+from database.models import BroadcastDelivery, BroadcastJob
+from services.users import mark_blocked
+
+logger = logging.getLogger(__name__)
+
+# Результаты отправки одному пользователю
+SENT = 'sent'
+BLOCKED = 'blocked'
+FAILED = 'failed'
+
+# Ошибки BadRequest, означающие, что писать пользователю бесполезно
+UNREACHABLE_ERRORS = ('chat not found', 'user is deactivated', 'bot was blocked')
+
+
+class TokenBucket:
+    """Ограничитель частоты отправки
+
+    Выдаёт не более rate токенов в секунду с запасом burst. По умолчанию
+    burst = 1, то есть отправки равномерно распределены и лимит не
+    превышается ни в одном окне длиной в секунду.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """Ожидание токена"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Остановка выдачи токенов (после RetryAfter)"""
+        now = time.monotonic()
+        self.paused_until = max(self.paused_until, now + seconds)
+        self.tokens = 0
+        self.updated = self.paused_until
+
+
+@dataclass
+class BroadcastStats:
+    """Статистика рассылки"""
+    total: int
+    sent: int = 0
+    blocked: int = 0
+    failed: int = 0
+    retries: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def done(self) -> int:
+        return self.sent + self.blocked + self.failed
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    @property
+    def rate(self) -> float:
+        """Сообщений в секунду"""
+        return self.done / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> float:
+        """Оставшееся время в секундах"""
+        return (self.total - self.done) / self.rate if self.rate > 0 else 0.0
+
+    def count(self, outcome: str):
+        if outcome == SENT:
+            self.sent += 1
+        elif outcome == BLOCKED:
+            self.blocked += 1
+        else:
+            self.failed += 1
+
+
+def classify_error(error: Exception) -> str:
+    """Результат отправки по исключению"""
+    if isinstance(error, TelegramForbiddenError):
+        return BLOCKED
+    if isinstance(error, TelegramBadRequest) and any(
+        text in error.message.lower() for text in UNREACHABLE_ERRORS
+    ):
+        return BLOCKED
+    return FAILED
+
+
+class BroadcastEngine:
+    """Параллельная рассылка с ограничением частоты
+
+    Несколько отправителей берут получателей из общей очереди, перед
+    каждой отправкой получают токен из общего TokenBucket. RetryAfter
+    приостанавливает всех отправителей на указанное Telegram время,
+    после чего отправка тому же пользователю повторяется (это не
+    считается попыткой). Сетевые ошибки и 5xx повторяются не более
+    max_retries раз.
+    """
+
+    def __init__(
+        self,
+        rate: float = settings.BROADCAST_RATE,
+        concurrency: int = settings.BROADCAST_CONCURRENCY,
+        max_retries: int = settings.BROADCAST_MAX_RETRIES,
+        progress_interval: float = settings.BROADCAST_PROGRESS_INTERVAL
+    ):
+        self.limiter = TokenBucket(rate)
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.progress_interval = progress_interval
+
+    async def _deliver(self, user_id: int, send: Callable[[int], Awaitable], stats: BroadcastStats) -> str:
+        failures = 0
+        while True:
+            await self.limiter.acquire()
+            try:
+                await send(user_id)
+                return SENT
+            except TelegramRetryAfter as e:
+                # Ограничение общее для бота, пользователь тут ни при чём
+                logger.warning(f"Рассылка: RetryAfter {e.retry_after} сек.")
+                self.limiter.pause(e.retry_after)
+                stats.retries += 1
+            except (TelegramNetworkError, TelegramServerError) as e:
+                failures += 1
+                if failures > self.max_retries:
+                    logger.warning(f"Ошибка отправки пользователю {user_id}: {e}")
+                    return FAILED
+                stats.retries += 1
+            except Exception as e:
+                outcome = classify_error(e)
+                if outcome == FAILED:
+                    logger.warning(f"Ошибка отправки пользователю {user_id}: {e}")
+                return outcome
+
+    async def run(
+        self,
+        user_ids: Iterable[int],
+        send: Callable[[int], Awaitable],
+        on_progress: Callable[[BroadcastStats], Awaitable] | None = None,
+        on_result: Callable[[int, str], None] | None = None,
+        stop: asyncio.Event | None = None
+    ) -> BroadcastStats:
+        """Рассылка по списку пользователей
+
+        send(user_id) отправляет сообщение одному пользователю,
+        on_progress(stats) вызывается раз в progress_interval секунд,
+        on_result(user_id, outcome) - после каждой отправки. Когда
+        установлен stop, новые отправки не начинаются.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        for user_id in user_ids:
+            queue.put_nowait(user_id)
+        stats = BroadcastStats(total=queue.qsize())
+
+        async def sender():
+            while stop is None or not stop.is_set():
+                try:
+                    user_id = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                outcome = await self._deliver(user_id, send, stats)
+                stats.count(outcome)
+                if on_result:
+                    on_result(user_id, outcome)
+
+        async def reporter():
+            while True:
+                await asyncio.sleep(self.progress_interval)
+                try:
+                    await on_progress(stats)
+                except Exception as e:
+                    logger.warning(f"Ошибка обновления прогресса рассылки: {e}")
+
+        progress_task = asyncio.create_task(reporter()) if on_progress else None
+        try:
+            await asyncio.gather(*(sender() for _ in range(self.concurrency)))
+        finally:
+            if progress_task:
+                progress_task.cancel()
+
+        return stats
+
+
+JOB_STATUS_TITLES = {
+    BroadcastJob.RUNNING: '📤 Рассылка идёт',
+    BroadcastJob.PAUSED: '⏸ Рассылка на паузе',
+    BroadcastJob.CANCELLED: '❌ Рассылка отменена',
+    BroadcastJob.DONE: '✅ Рассылка завершена',
+}
+
+
+def job_status_text(job: BroadcastJob, stats: BroadcastStats | None = None) -> str:
+    """Текст статуса задания рассылки"""
+    text = (
+        f"{JOB_STATUS_TITLES.get(job.status, job.status)} <b>#{job.id}</b>\n\n"
+        f"📊 Статистика:\n"
+        f"├ Успешно: {job.sent}\n"
+        f"├ Заблокировали бота: {job.blocked}\n"
+        f"├ Ошибок: {job.failed}\n"
+        f"└ Обработано: {job.done} из {job.total}"
+    )
+    if stats is not None and job.status == BroadcastJob.RUNNING and stats.rate > 0:
+        eta = (job.total - job.done) / stats.rate
+        text += f"\n\n⚡ {stats.rate:.1f} сообщ./сек, осталось ~{eta:.0f} сек"
+    return text
+
+
+class BroadcastWorker:
+    """Фоновое выполнение сохранённых заданий рассылки
+
+    Получатели и их состояние хранятся в broadcast_deliveries, поэтому
+    после перезапуска задания в статусе running продолжаются с тех, кому
+    сообщение ещё не отправлено. Результаты записываются одним commit
+    на пакет из batch_size получателей.
+    """
+
+    def __init__(
+        self,
+        session_maker: async_sessionmaker,
+        batch_size: int = settings.BROADCAST_COMMIT_BATCH,
+        progress_interval: float = settings.BROADCAST_PROGRESS_INTERVAL,
+        poll_interval: float = settings.BROADCAST_POLL_INTERVAL
+    ):
+        self.session_maker = session_maker
+        self.batch_size = batch_size
+        self.progress_interval = progress_interval
+        self.poll_interval = poll_interval
+        self.engine = BroadcastEngine()
+        self.bot: Bot | None = None
+        self.current_job_id: int | None = None
+        self._interrupt = asyncio.Event()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task: asyncio.Task | None = None
+
+    def start(self, bot: Bot):
+        """Запуск фоновой задачи (продолжает незавершённые рассылки)"""
+        self.bot = bot
+        self._stopping = False
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name='broadcast-worker')
+
+    async def stop(self, timeout: float = settings.SIDE_EFFECT_DRAIN_TIMEOUT):
+        """Остановка с сохранением результатов текущего пакета"""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._interrupt.set()
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            pass
+        self._task = None
+
+    def wake(self):
+        """Сигнал о новом или возобновлённом задании"""
+        self._wakeup.set()
+
+    def interrupt(self, job_id: int):
+        """Прерывание текущего задания после пауз и отмены"""
+        if job_id == self.current_job_id:
+            self._interrupt.set()
+
+    async def create_job(
+        self,
+        session: AsyncSession,
+        from_chat_id: int,
+        message_id: int,
+        user_ids: list[int],
+        status_chat_id: int | None = None,
+        status_message_id: int | None = None
+    ) -> BroadcastJob:
+        """Сохранение задания рассылки и списка получателей"""
+        job = BroadcastJob(
+            from_chat_id=from_chat_id,
+            message_id=message_id,
+            total=len(user_ids),
+            status_chat_id=status_chat_id,
+            status_message_id=status_message_id
+        )
+        session.add(job)
+        await session.flush()
+
+        for i in range(0, len(user_ids), self.batch_size * 10):
+            await session.execute(
+                insert(BroadcastDelivery),
+                [{'job_id': job.id, 'user_id': user_id} for user_id in user_ids[i:i + self.batch_size * 10]]
+            )
+
+        await session.commit()
+        self.wake()
+        return job
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                job_id = await self._next_job()
+                if job_id is not None:
+                    await self._process(job_id)
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка выполнения рассылки: {e}")
+                await asyncio.sleep(self.progress_interval)
+                continue
+
+            # Задание могло быть создано или возобновлено в другом процессе
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _next_job(self) -> int | None:
+        async with self.session_maker() as session:
+            result = await session.execute(
+                select(BroadcastJob.id)
+                .where(BroadcastJob.status == BroadcastJob.RUNNING)
+                .order_by(BroadcastJob.id)
+                .limit(1)
+            )
+            return result.scalar()
+
+    async def _process(self, job_id: int):
+        self.current_job_id = job_id
+        if not self._stopping:
+            self._interrupt.clear()
+        stats = BroadcastStats(total=0)
+        last_report = 0.0
+
+        try:
+            while not self._interrupt.is_set():
+                async with self.session_maker() as session:
+                    job = await session.get(BroadcastJob, job_id)
+                    if job is None or job.status != BroadcastJob.RUNNING:
+                        return
+
+                    result = await session.execute(
+                        select(BroadcastDelivery.user_id)
+                        .where(
+                            BroadcastDelivery.job_id == job_id,
+                            BroadcastDelivery.status == BroadcastDelivery.PENDING
+                        )
+                        .limit(self.batch_size)
+                    )
+                    user_ids = result.scalars().all()
+
+                    if not user_ids:
+                        job.status = BroadcastJob.DONE
+                        job.finished_at = datetime.now()
+                        await session.commit()
+                        await self._report(job)
+                        logger.info(f"Рассылка #{job_id} завершена")
+                        return
+
+                async def send(user_id: int, job=job):
+                    await self.bot.copy_message(
+                        chat_id=user_id,
+                        from_chat_id=job.from_chat_id,
+                        message_id=job.message_id
+                    )
+
+                results: dict[int, str] = {}
+                batch_stats = await self.engine.run(
+                    user_ids,
+                    send,
+                    on_result=results.__setitem__,
+                    stop=self._interrupt
+                )
+                stats.sent += batch_stats.sent
+                stats.blocked += batch_stats.blocked
+                stats.failed += batch_stats.failed
+
+                job = await self._save(job_id, results)
+
+                if time.monotonic() - last_report >= self.progress_interval:
+                    await self._report(job, stats)
+                    last_report = time.monotonic()
+        finally:
+            self.current_job_id = None
+
+    async def _save(self, job_id: int, results: dict[int, str]) -> BroadcastJob:
+        """Запись результатов пакета одним commit"""
+        by_outcome: dict[str, list[int]] = {}
+        for user_id, outcome in results.items():
+            by_outcome.setdefault(outcome, []).append(user_id)
+
+        async with self.session_maker() as session:
+            for outcome, user_ids in by_outcome.items():
+                await session.execute(
+                    update(BroadcastDelivery)
+                    .where(
+                        BroadcastDelivery.job_id == job_id,
+                        BroadcastDelivery.user_id.in_(user_ids)
+                    )
+                    .values(status=outcome, updated_at=datetime.now())
+                )
+
+            await session.execute(
+                update(BroadcastJob)
+                .where(BroadcastJob.id == job_id)
+                .values(
+                    sent=BroadcastJob.sent + len(by_outcome.get(SENT, [])),
+                    blocked=BroadcastJob.blocked + len(by_outcome.get(BLOCKED, [])),
+                    failed=BroadcastJob.failed + len(by_outcome.get(FAILED, []))
+                )
+            )
+            # Заблокировавшие бота исключаются из следующих рассылок
+            await mark_blocked(session, by_outcome.get(BLOCKED, []))
+            await session.commit()
+            return await session.get(BroadcastJob, job_id, populate_existing=True)
+
+    async def _report(self, job: BroadcastJob, stats: BroadcastStats | None = None):
+        """Обновление сообщения со статусом рассылки"""
+        if not job.status_chat_id or not job.status_message_id:
+            return
+        try:
+            await self.bot.edit_message_text(
+                text=job_status_text(job, stats),
+                chat_id=job.status_chat_id,
+                message_id=job.status_message_id,
+                parse_mode='HTML'
+            )
+        except Exception as e:
+            logger.warning(f"Ошибка обновления статуса рассылки #{job.id}: {e}")
+
+
+broadcast_worker = BroadcastWorker(async_session_maker)
@@ -0,0 +1,206 @@
+import codecs
+import csv
+import gzip
+import io
+import tempfile
+import zipfile
+from datetime import datetime
+from typing import AsyncGenerator
+from aiogram import Bot
+from aiogram.types import InputFile
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config.settings import settings
+from database.models import Request
+
+COMPRESSIONS = ('none', 'gzip', 'zip')
+
+EXPORT_HEADER = [
+    'ID', 'User ID', 'Username', 'Направление', 'Дата вылета',
+    'Ночей', 'Взрослых', 'Детей', 'Бюджет', 'Комментарий', 'Создана'
+]
+
+# Только нужные колонки, без построения ORM-объектов
+EXPORT_COLUMNS = (
+    Request.id,
+    Request.user_id,
+    Request.username,
+    Request.destination,
+    Request.departure_date,
+    Request.nights,
+    Request.adults,
+    Request.children,
+    Request.budget,
+    Request.comment,
+    Request.created_at,
+)
+
+
+def export_row(row) -> list:
+    """Строка CSV для выборки EXPORT_COLUMNS"""
+    (id_, user_id, username, destination, departure_date,
+     nights, adults, children, budget, comment, created_at) = row
+    return [
+        id_,
+        user_id,
+        username or 'N/A',
+        destination,
+        departure_date,
+        nights,
+        adults,
+        children,
+        budget,
+        comment or 'Нет',
+        created_at.strftime('%d.%m.%Y %H:%M')
+    ]
+
+
+class SpooledInputFile(InputFile):
+    """Отправка документа из временного файла по частям"""
+
+    def __init__(self, file, filename: str):
+        super().__init__(filename=filename)
+        self.file = file
+
+    async def read(self, bot: Bot) -> AsyncGenerator[bytes, None]:
+        self.file.seek(0)
+        while chunk := self.file.read(self.chunk_size):
+            yield chunk
+
+
+class ExportPart:
+    """Одна часть экспорта во временном файле"""
+
+    def __init__(self, basename: str, compression: str):
+        self.raw = tempfile.SpooledTemporaryFile(max_size=settings.EXPORT_SPOOL_SIZE)
+        self._zip = None
+        self.rows = 0
+
+        if compression == 'gzip':
+            self.filename = f"{basename}.csv.gz"
+            self.stream = gzip.GzipFile(filename=f"{basename}.csv", fileobj=self.raw, mode='wb')
+        elif compression == 'zip':
+            self.filename = f"{basename}.zip"
+            self._zip = zipfile.ZipFile(self.raw, 'w', compression=zipfile.ZIP_DEFLATED)
+            self.stream = self._zip.open(f"{basename}.csv", 'w', force_zip64=True)
+        else:
+            self.filename = f"{basename}.csv"
+            self.stream = self.raw
+
+        # BOM для корректного открытия в Excel
+        self.stream.write(codecs.BOM_UTF8)
+
+    @property
+    def size(self) -> int:
+        """Размер уже записанных (сжатых) данных"""
+        return self.raw.tell()
+
+    def write(self, data: bytes, rows: int):
+        self.stream.write(data)
+        self.rows += rows
+
+    def finish(self):
+        """Завершение записи, файл готов к отправке"""
+        if self.stream is not self.raw:
+            self.stream.close()
+        if self._zip is not None:
+            self._zip.close()
+        self.raw.seek(0)
+
+    def input_file(self) -> SpooledInputFile:
+        return SpooledInputFile(self.raw, filename=self.filename)
+
+    def close(self):
+        self.raw.close()
+
+
+class RequestsExport:
+    """Потоковый экспорт заявок в CSV
+
+    Строки читаются из БД пакетами по EXPORT_BATCH_SIZE, кодируются
+    по мере чтения и пишутся во временные файлы. Когда часть приближается
+    к EXPORT_PART_SIZE, начинается новая, со своей строкой заголовков.
+    """
+
+    def __init__(self, compression: str = settings.EXPORT_COMPRESSION):
+        if compression not in COMPRESSIONS:
+            compression = 'none'
+        self.compression = compression
+        self.basename = f"requests_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        self.parts: list[ExportPart] = []
+        self.total = 0
+
+    def _new_part(self) -> ExportPart:
+        suffix = f"_{len(self.parts) + 1}" if self.parts else ''
+        part = ExportPart(self.basename + suffix, self.compression)
+        part.write(self._encode([EXPORT_HEADER]), rows=0)
+        self.parts.append(part)
+        return part
+
+    @staticmethod
+    def _encode(rows: list) -> bytes:
+        buffer = io.StringIO()
+        csv.writer(buffer, delimiter=';').writerows(rows)
+        return buffer.getvalue().encode('utf-8')
+
+    async def build(self, session: AsyncSession) -> 'RequestsExport':
+        """Чтение заявок из БД и запись частей экспорта"""
+        result = await session.stream(
+            select(*EXPORT_COLUMNS)
+            .order_by(Request.created_at.desc())
+            .execution_options(yield_per=settings.EXPORT_BATCH_SIZE)
+        )
+
+        part = self._new_part()
+        async for partition in result.partitions():
+            if part.rows and part.size >= settings.EXPORT_PART_SIZE:
+                part.finish()
+                part = self._new_part()
+
+            part.write(self._encode([export_row(row) for row in partition]), rows=len(partition))
+            self.total += len(partition)
+
+        part.finish()
+        return self
+
+    def close(self):
+        for part in self.parts:
+            part.close()
+        self.parts = []
+
+
+class ExportCache:
+    """file_id последнего отправленного экспорта
+
+    Отпечаток таблицы (max(id), число заявок, счётчик удалений) считается
+    одним лёгким запросом. Пока он не изменился, экспорт не строится
+    заново, а документы пересылаются по file_id.
+    """
+
+    def __init__(self):
+        self.deletions = 0
+        self._fingerprint = None
+        self._documents: list[tuple[str, str]] = []
+
+    async def fingerprint(self, session: AsyncSession, compression: str) -> tuple:
+        result = await session.execute(select(func.max(Request.id), func.count(Request.id)))
+        max_id, total = result.one()
+        return (max_id, total, self.deletions, compression)
+
+    def get(self, fingerprint: tuple) -> list[tuple[str, str]] | None:
+        """Список (file_id, подпись) или None, если таблица изменилась"""
+        if fingerprint != self._fingerprint:
+            return None
+        return self._documents
+
+    def set(self, fingerprint: tuple, documents: list[tuple[str, str]]):
+        self._fingerprint = fingerprint
+        self._documents = documents
+
+    def note_delete(self):
+        """Учёт удаления заявки"""
+        self.deletions += 1
+
+
+export_cache = ExportCache()
@@ -1,62 +1,285 @@
 import gspread
+from gspread.exceptions import APIError, SpreadsheetNotFound, WorksheetNotFound
 from google.oauth2.service_account import Credentials
 from config.settings import settings
+from services.metrics import sheets_call_seconds
+from services.tracing import record
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
+import logging
 import os
 import json
+import threading
+import time
 
-def _sync_save_to_sheets(request):
-    """Синхронное сохранение в Google Sheets"""
-    try:
-        scopes = [
-            'https://www.googleapis.com/auth/spreadsheets',
-            'https://www.googleapis.com/auth/drive'
-        ]
-        
-        # ============ ВАЖНАЯ ЧАСТЬ ============
-        # Проверяем, есть ли переменная GOOGLE_CREDENTIALS_JSON
-        credentials_json = os.getenv('GOOGLE_CREDENTIALS_JSON')
-        
-        if credentials_json:
-            # На Railway: парсим JSON из переменной
-            credentials_dict = json.loads(credentials_json)
-            creds = Credentials.from_service_account_info(
-                credentials_dict,
-                scopes=scopes
+logger = logging.getLogger(__name__)
+
+SCOPES = [
+    'https://www.googleapis.com/auth/spreadsheets',
+    'https://www.googleapis.com/auth/drive'
+]
+
+# Ошибки, после которых нужно заново открыть таблицу
+REOPEN_STATUS_CODES = (401, 403, 404)
+
+
+def _load_credentials() -> Credentials:
+    """Загрузка учётных данных сервисного аккаунта"""
+    # ============ ВАЖНАЯ ЧАСТЬ ============
+    # Проверяем, есть ли переменная GOOGLE_CREDENTIALS_JSON
+    credentials_json = os.getenv('GOOGLE_CREDENTIALS_JSON')
+
+    if credentials_json:
+        # На Railway: парсим JSON из переменной
+        credentials_dict = json.loads(credentials_json)
+        return Credentials.from_service_account_info(
+            credentials_dict,
+            scopes=SCOPES
+        )
+
+    # Локально: читаем из файла
+    return Credentials.from_service_account_file(
+        settings.CREDENTIALS_FILE,
+        scopes=SCOPES
+    )
+
+
+def request_to_row(request) -> list:
+    """Строка таблицы для заявки"""
+    return [
+        request.id,
+        request.user_id,
+        request.username or 'N/A',
+        request.destination,
+        request.departure_date,
+        request.nights,
+        request.adults,
+        request.children,
+        request.budget,
+        request.comment or 'Нет',
+        request.created_at.strftime('%d.%m.%Y %H:%M')
+    ]
+
+
+class SheetsClient:
+    """Долгоживущий клиент Google Sheets
+
+    Учётные данные разбираются один раз, токен обновляется сессией gspread
+    только при истечении, а лист переоткрывается лишь после ошибок
+    авторизации или «не найдено». Все вызовы идут через свой пул потоков.
+    """
+
+    def __init__(self, spreadsheet_id: str = None, max_workers: int = settings.SHEETS_MAX_WORKERS):
+        self.spreadsheet_id = spreadsheet_id or settings.SPREADSHEET_ID
+        self.max_workers = max_workers
+        self._credentials = None
+        self._worksheet = None
+        self._lock = threading.Lock()
+        self._executor = None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix='sheets'
             )
-        else:
-            # Локально: читаем из файла
-            creds = Credentials.from_service_account_file(
-                settings.CREDENTIALS_FILE,
-                scopes=scopes
+        return self._executor
+
+    def _get_worksheet(self):
+        """Открытый лист (создаётся при первом обращении)"""
+        with self._lock:
+            if self._worksheet is None:
+                if self._credentials is None:
+                    self._credentials = _load_credentials()
+                client = gspread.authorize(self._credentials)
+                self._worksheet = client.open_by_key(self.spreadsheet_id).sheet1
+                logger.info("Google Sheets: таблица открыта")
+            return self._worksheet
+
+    def reset(self):
+        """Сброс открытого листа, следующий вызов откроет его заново"""
+        with self._lock:
+            self._worksheet = None
+
+    def _call(self, method: str, *args, **kwargs):
+        """Синхронный вызов метода листа с одним переоткрытием при ошибке"""
+        try:
+            return getattr(self._get_worksheet(), method)(*args, **kwargs)
+        except (SpreadsheetNotFound, WorksheetNotFound):
+            pass
+        except APIError as e:
+            if e.response.status_code not in REOPEN_STATUS_CODES:
+                raise
+
+        logger.warning("Google Sheets: переоткрываем таблицу")
+        self.reset()
+        return getattr(self._get_worksheet(), method)(*args, **kwargs)
+
+    async def run(self, method: str, *args, **kwargs):
+        """Асинхронный вызов метода листа в пуле потоков клиента"""
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        outcome = 'ok'
+        try:
+            return await loop.run_in_executor(
+                self.executor,
+                partial(self._call, method, *args, **kwargs)
             )
-        # ======================================
-        
-        client = gspread.authorize(creds)
-        sheet = client.open_by_key(settings.SPREADSHEET_ID).sheet1
-        
-        row = [
-            request.id,
-            request.user_id,
-            request.username or 'N/A',
-            request.destination,
-            request.departure_date,
-            request.nights,
-            request.adults,
-            request.children,
-            request.budget,
-            request.comment or 'Нет',
-            request.created_at.strftime('%d.%m.%Y %H:%M')
-        ]
-        
-        sheet.append_row(row)
-        
-    except Exception as e:
-        print(f"Ошибка записи в Google Sheets: {e}")
-        raise
-
-async def save_to_sheets(request):
-    """Асинхронное сохранение в Google Sheets"""
-    loop = asyncio.get_event_loop()
-    await loop.run_in_executor(None, partial(_sync_save_to_sheets, request))
+        except Exception:
+            outcome = 'error'
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            sheets_call_seconds.observe(duration, method, outcome)
+            record(f'sheets.{method}', started, duration)
+
+    async def append_row(self, row: list):
+        return await self.run('append_row', row)
+
+    async def append_rows(self, rows: list):
+        return await self.run('append_rows', rows)
+
+    def close(self):
+        """Остановка пула потоков"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+class SheetsBatchWriter:
+    """Пакетная запись строк в Google Sheets
+
+    Строки копятся в очереди, фоновая задача отправляет их одним
+    append_rows, когда набирается batch_size строк или проходит
+    flush_interval миллисекунд с первой строки пакета. Если очередь
+    заполнена, submit ждёт освобождения места.
+    """
+
+    def __init__(
+        self,
+        client: SheetsClient,
+        batch_size: int = settings.SHEETS_BATCH_SIZE,
+        flush_interval: int = settings.SHEETS_FLUSH_INTERVAL_MS,
+        queue_size: int = settings.SHEETS_QUEUE_SIZE
+    ):
+        self.client = client
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval / 1000
+        self.queue_size = queue_size
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self.stats = {
+            'batches': 0,
+            'rows': 0,
+            'failed_batches': 0,
+            'last_batch_size': 0,
+            'max_batch_size': 0,
+            'last_flush_ms': 0.0,
+            'total_flush_ms': 0.0,
+        }
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Запуск фоновой задачи записи"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._task = asyncio.create_task(self._run(), name='sheets-batch-writer')
+
+    async def stop(self):
+        """Запись оставшихся строк и остановка"""
+        if not self.running:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def submit(self, row: list) -> asyncio.Future:
+        """Постановка строки в очередь
+
+        Возвращает future, который завершится после записи пакета.
+        """
+        future = asyncio.get_running_loop().create_future()
+        if not self.running:
+            # Запись без пакетирования, если фоновая задача не запущена
+            try:
+                await self.client.append_row(row)
+                future.set_result(None)
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        await self._queue.put((row, future))
+        return future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            await self._flush(batch)
+
+        # Остатки после сигнала остановки
+        batch = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not None:
+                batch.append(item)
+        for i in range(0, len(batch), self.batch_size):
+            await self._flush(batch[i:i + self.batch_size])
+
+    async def _flush(self, batch: list):
+        rows = [row for row, _ in batch]
+        started = time.perf_counter()
+        try:
+            await self.client.append_rows(rows)
+        except Exception as e:
+            self.stats['failed_batches'] += 1
+            logger.error(f"Ошибка пакетной записи в Google Sheets ({len(rows)} строк): {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            self.stats['last_flush_ms'] = elapsed
+            self.stats['total_flush_ms'] += elapsed
+
+        self.stats['batches'] += 1
+        self.stats['rows'] += len(rows)
+        self.stats['last_batch_size'] = len(rows)
+        self.stats['max_batch_size'] = max(self.stats['max_batch_size'], len(rows))
+        logger.debug(f"Google Sheets: записано {len(rows)} строк за {elapsed:.0f} мс")
+
+        for _, future in batch:
+            if not future.done():
+                future.set_result(None)
+
+
+sheets_client = SheetsClient()
+sheets_writer = SheetsBatchWriter(sheets_client)
@@ -0,0 +1,145 @@
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Tuple
+
+from aiohttp import web
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from services.tracing import record
+
+# Границы корзин гистограмм по умолчанию (сек.)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    parts = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+class Counter:
+    """Счётчик с метками (значения меток передаются позиционно)"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_labels(self.labels, key)} {value}" for key, value in self.values.items()]
+
+
+class Histogram:
+    """Гистограмма с метками: на наблюдение - один bisect и три сложения"""
+
+    kind = 'histogram'
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: Iterable[str] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = buckets
+        # метки -> [счётчики корзин (+Inf последней), сумма, количество]
+        self.values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str):
+        series = self.values.get(labels)
+        if series is None:
+            series = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                bucket = _labels(self.labels, key, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{bucket} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {count}")
+        return lines
+
+
+class Registry:
+    """Набор метрик процесса в текстовом формате Prometheus"""
+
+    def __init__(self):
+        self.metrics: List[Counter | Histogram] = []
+
+    def counter(self, name: str, help_text: str, labels: Iterable[str] = ()) -> Counter:
+        metric = Counter(name, help_text, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help_text: str, labels: Iterable[str] = ()) -> Histogram:
+        metric = Histogram(name, help_text, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+updates_total = registry.counter('tourbot_updates_total', 'Обработанные апдейты', ('type', 'outcome'))
+handler_seconds = registry.histogram('tourbot_handler_seconds', 'Время работы хендлеров', ('handler',))
+throttled_total = registry.counter('tourbot_throttled_total', 'Запросы, отбитые антиспамом')
+throttle_errors_total = registry.counter('tourbot_throttle_errors_total', 'Ошибки хранилища антиспама (запрос пропущен)')
+fsm_transitions_total = registry.counter('tourbot_fsm_transitions_total', 'Переходы FSM', ('state',))
+db_query_seconds = registry.histogram('tourbot_db_query_seconds', 'Время запросов к БД', ('operation',))
+sheets_call_seconds = registry.histogram('tourbot_sheets_call_seconds', 'Время вызовов Google Sheets', ('method', 'outcome'))
+telegram_call_seconds = registry.histogram('tourbot_telegram_call_seconds', 'Время вызовов Telegram API', ('method', 'outcome'))
+
+
+def instrument_engine(engine: Engine):
+    """Замер времени запросов к БД через события SQLAlchemy (метрики и спаны)"""
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement else 'UNKNOWN'
+        duration = time.perf_counter() - context._query_started
+        db_query_seconds.observe(duration, operation)
+        record(f'db.{operation.lower()}', context._query_started, duration)
+
+
+async def metrics_view(request: web.Request) -> web.Response:
+    """GET /metrics"""
+    return web.Response(text=registry.render(), content_type='text/plain', charset='utf-8')
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    """Отдельный HTTP-сервер только с /metrics (на внутреннем порту, не на порту вебхука)"""
+    app = web.Application()
+    app.router.add_get('/metrics', metrics_view)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host=host, port=port).start()
+    return runner
@@ -1,26 +1,28 @@
-import gspread
-from google.oauth2.service_account import Credentials
-from datetime import datetime
-from aiogram.types import User
+import logging
+from html import escape
+from aiogram import Bot
+
 from config.settings import settings
-import asyncio
-from functools import partial
+from database.models import Request
+
+logger = logging.getLogger(__name__)
+
+
+def request_text(request: Request) -> str:
+    """Текст уведомления о заявке (HTML)"""
+    return (
+        f"🆕 <b>Новая заявка #{request.id}</b>\n\n"
+        f"👤 @{escape(request.username or 'N/A')} (ID: <code>{request.user_id}</code>)\n"
+        f"🌍 {escape(request.destination)} | 📅 {escape(request.departure_date)}\n"
+        f"🌙 {request.nights} ночей | 👥 {request.adults}+{request.children}\n"
+        f"💰 {request.budget:,}₽\n"
+        f"💬 {escape(request.comment or '-')}"
+    )
 
-async def send_to_sheets(data: dict, user: User):
-    loop = asyncio.get_event_loop()
-    await loop.run_in_executor(None, partial(_send_to_sheets_sync, data, user))
 
-def _send_to_sheets_sync(data: dict, user: User):
-    try:
-        scope = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
-        creds = Credentials.from_service_account_file(settings.sheets.credentials_file, scopes=scope)
-        client = gspread.authorize(creds)
-        sheet = client.open_by_key(settings.sheets.spreadsheet_id).sheet1
-        row = [datetime.now().strftime("%d.%m.%Y %H:%M"), user.id, user.username or "Нет",
-               user.first_name or "Нет", data.get('destination', '-'), data.get('departure_city', '-'),
-               data.get('departure_date', '-'), data.get('duration', '-'), data.get('adults', 0),
-               data.get('children', 0), data.get('budget', '-'), data.get('additional_info', 'Нет')]
-        sheet.append_row(row)
-        print("✅ Отправлено в Sheets")
-    except Exception as e:
-        print(f"❌ Sheets error: {e}")
+async def notify_admin(request: Request, bot: Bot):
+    """Уведомление админа о новой заявке (ошибки логирует вызывающий)"""
+    if not settings.ADMIN_CHAT_ID:
+        return
+    await bot.send_message(settings.ADMIN_CHAT_ID, request_text(request))
+    logger.info(f"Админ уведомлён о заявке #{request.id}")
@@ -0,0 +1,190 @@
+import asyncio
+import json
+import logging
+import multiprocessing
+import queue
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import aiohttp
+
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_API = 'https://api.telegram.org'
+
+
+def update_user_id(update: Dict[str, Any]) -> Optional[int]:
+    """Id отправителя (или чата) из «сырого» апдейта без разбора в pydantic"""
+    for key, value in update.items():
+        if key == 'update_id' or not isinstance(value, dict):
+            continue
+        sender = value.get('from') or value.get('user')
+        if sender:
+            return sender.get('id')
+        chat = value.get('chat')
+        if chat:
+            return chat.get('id')
+    return None
+
+
+def shard_for(update: Dict[str, Any], shards: int, admin_id: int = settings.ADMIN_CHAT_ID) -> int:
+    """Номер рабочего процесса для апдейта
+
+    Апдейты одного пользователя всегда попадают в один процесс, поэтому
+    его FSM, кэши и антиспам остаются в памяти одного процесса. Админ
+    закреплён за нулевым процессом, где работают рассылки.
+    """
+    user_id = update_user_id(update)
+    if user_id is None:
+        return update.get('update_id', 0) % shards
+    if user_id == admin_id:
+        return 0
+    return user_id % shards
+
+
+class ShardPool:
+    """Рабочие процессы, между которыми распределяются апдейты
+
+    Каждый процесс получает апдейты JSON-строками через свою очередь
+    и обрабатывает их своим диспетчером (target(index, queue)). Упавший
+    процесс перезапускается с той же очередью.
+    """
+
+    def __init__(
+        self,
+        target: Callable[[int, Any], None],
+        workers: int = settings.SHARD_WORKERS,
+        queue_size: int = settings.SHARD_QUEUE_SIZE,
+        check_interval: float = 5.0
+    ):
+        self._ctx = multiprocessing.get_context('spawn')
+        self.target = target
+        self.check_interval = check_interval
+        self.queues = [self._ctx.Queue(queue_size) for _ in range(workers)]
+        self.processes: List[Optional[multiprocessing.Process]] = [None] * workers
+        self.stats = {
+            'routed': [0] * workers,
+            'restarts': 0,
+        }
+        self._watchdog: asyncio.Task | None = None
+
+    def _spawn(self, index: int):
+        process = self._ctx.Process(
+            target=self.target,
+            args=(index, self.queues[index]),
+            name=f'shard-{index}'
+        )
+        process.start()
+        self.processes[index] = process
+
+    def start(self):
+        for index in range(len(self.queues)):
+            self._spawn(index)
+        self._watchdog = asyncio.create_task(self._watch(), name='shard-watchdog')
+        logger.info(f"Запущено рабочих процессов: {len(self.queues)}")
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            for index, process in enumerate(self.processes):
+                if process is not None and not process.is_alive():
+                    logger.error(f"Процесс shard-{index} завершился (код {process.exitcode}), перезапуск")
+                    self.stats['restarts'] += 1
+                    self._spawn(index)
+
+    async def route(self, update: Dict[str, Any], raw: Optional[str] = None):
+        """Передача апдейта процессу (при переполнении очереди - ожидание)"""
+        index = shard_for(update, len(self.queues))
+        payload = raw if raw is not None else json.dumps(update)
+        try:
+            self.queues[index].put_nowait(payload)
+        except queue.Full:
+            await asyncio.get_running_loop().run_in_executor(None, self.queues[index].put, payload)
+        self.stats['routed'][index] += 1
+
+    async def stop(self, timeout: float = settings.SIDE_EFFECT_DRAIN_TIMEOUT):
+        """Остановка: процессы дообрабатывают очередь и завершаются"""
+        if self._watchdog is not None:
+            self._watchdog.cancel()
+            self._watchdog = None
+
+        loop = asyncio.get_running_loop()
+        for q in self.queues:
+            await loop.run_in_executor(None, q.put, None)
+
+        for index, process in enumerate(self.processes):
+            if process is None:
+                continue
+            await loop.run_in_executor(None, process.join, timeout * 2)
+            if process.is_alive():
+                logger.warning(f"Процесс shard-{index} не завершился вовремя, остановка")
+                process.terminate()
+
+
+async def serve_shard(
+    updates: Any,
+    handle: Callable[[Dict[str, Any]], Awaitable],
+    drain_timeout: float = settings.SIDE_EFFECT_DRAIN_TIMEOUT
+):
+    """Цикл рабочего процесса: чтение очереди до None и обработка апдейтов"""
+    loop = asyncio.get_running_loop()
+    tasks: set[asyncio.Task] = set()
+
+    async def process(raw: str):
+        try:
+            await handle(json.loads(raw))
+        except Exception as e:
+            logger.error(f"Ошибка обработки апдейта: {e}")
+
+    while True:
+        raw = await loop.run_in_executor(None, updates.get)
+        if raw is None:
+            break
+        task = asyncio.create_task(process(raw))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    if tasks:
+        await asyncio.wait(tasks, timeout=drain_timeout)
+
+
+async def poll_raw_updates(
+    token: str,
+    allowed_updates: List[str],
+    on_update: Callable[[Dict[str, Any]], Awaitable],
+    timeout: int = 30
+):
+    """Long polling без разбора апдейтов в pydantic (для процесса-маршрутизатора)"""
+    url = f"{TELEGRAM_API}/bot{token}/getUpdates"
+    offset = None
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout + 10)) as session:
+        while True:
+            params = {'timeout': timeout, 'allowed_updates': json.dumps(allowed_updates)}
+            if offset is not None:
+                params['offset'] = offset
+            try:
+                async with session.get(url, params=params) as response:
+                    result = await response.json()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # В том числе не-JSON ответ от прокси или балансировщика
+                logger.error(f"Ошибка получения апдейтов: {e}")
+                await asyncio.sleep(1)
+                continue
+
+            if not result.get('ok'):
+                logger.error(f"Ошибка getUpdates: {result.get('description')}")
+                await asyncio.sleep(result.get('parameters', {}).get('retry_after', 1))
+                continue
+
+            for update in result.get('result', []):
+                try:
+                    await on_update(update)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    # Один сломанный апдейт не должен останавливать поллинг
+                    logger.error(f"Ошибка маршрутизации апдейта {update.get('update_id')}: {e}")
+                offset = update['update_id'] + 1
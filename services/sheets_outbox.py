@@ -0,0 +1,165 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from config.settings import settings
+from database.database import async_session_maker
+from database.models import Request, SheetsOutbox
+from services.google_sheets import SheetsBatchWriter, request_to_row, sheets_writer
+
+logger = logging.getLogger(__name__)
+
+
+def add_to_outbox(session: AsyncSession, request: Request) -> SheetsOutbox:
+    """Добавление заявки в очередь выгрузки
+
+    Заявка должна быть уже отправлена в БД (session.flush), чтобы у неё
+    были id и created_at. Запись фиксируется тем же commit, что и заявка.
+    """
+    entry = SheetsOutbox(request_id=request.id, payload=request_to_row(request))
+    session.add(entry)
+    return entry
+
+
+class SheetsOutboxWorker:
+    """Фоновая выгрузка очереди заявок в Google Sheets
+
+    Забирает ожидающие записи пакетами, при ошибке откладывает их
+    с экспоненциальной задержкой, а после max_attempts переводит
+    в состояние dead. После перезапуска дочитывает всё, что осталось.
+
+    Пакет сначала занимается отдельной транзакцией (next_attempt_at
+    сдвигается на claim_timeout), запись в Google Sheets идёт без
+    открытой транзакции, а результаты сохраняются второй транзакцией.
+    """
+
+    def __init__(
+        self,
+        session_maker: async_sessionmaker,
+        writer: SheetsBatchWriter,
+        batch_size: int = settings.OUTBOX_BATCH_SIZE,
+        poll_interval: float = settings.OUTBOX_POLL_INTERVAL,
+        max_attempts: int = settings.OUTBOX_MAX_ATTEMPTS,
+        retry_base: float = settings.OUTBOX_RETRY_BASE,
+        retry_max: float = settings.OUTBOX_RETRY_MAX,
+        claim_timeout: float = settings.OUTBOX_CLAIM_TIMEOUT
+    ):
+        self.session_maker = session_maker
+        self.writer = writer
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.claim_timeout = claim_timeout
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        """Запуск фоновой задачи"""
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._task = asyncio.create_task(self._run(), name='sheets-outbox')
+
+    async def stop(self, timeout: float = settings.SIDE_EFFECT_DRAIN_TIMEOUT):
+        """Остановка после текущего пакета (его результаты сохраняются)"""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            pass
+        self._task = None
+
+    def wake(self):
+        """Сигнал о новых записях в очереди"""
+        self._wakeup.set()
+
+    def retry_delay(self, attempts: int) -> timedelta:
+        """Задержка перед следующей попыткой"""
+        return timedelta(seconds=min(self.retry_max, self.retry_base * 2 ** (attempts - 1)))
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                processed = await self.drain_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка обработки очереди Google Sheets: {e}")
+                processed = 0
+
+            if processed >= self.batch_size or self._stopping:
+                continue
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def drain_once(self) -> int:
+        """Отправка одного пакета, возвращает число обработанных записей"""
+        entries = await self._claim()
+        if not entries:
+            return 0
+
+        futures = [await self.writer.submit(entry.payload) for entry in entries]
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        await self._save_results(entries, results)
+        return len(entries)
+
+    async def _claim(self) -> list:
+        """Занятие пакета: до claim_timeout его не возьмёт другой процесс"""
+        async with self.session_maker() as session:
+            now = datetime.now()
+            result = await session.execute(
+                select(SheetsOutbox)
+                .where(
+                    SheetsOutbox.status == SheetsOutbox.PENDING,
+                    SheetsOutbox.next_attempt_at <= now
+                )
+                .order_by(SheetsOutbox.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            entries = result.scalars().all()
+            if entries:
+                await session.execute(
+                    update(SheetsOutbox)
+                    .where(SheetsOutbox.id.in_([entry.id for entry in entries]))
+                    .values(next_attempt_at=now + timedelta(seconds=self.claim_timeout))
+                )
+                await session.commit()
+            return entries
+
+    async def _save_results(self, entries: list, results: list):
+        """Отметка отправленных записей и перенос неудачных"""
+        async with self.session_maker() as session:
+            now = datetime.now()
+            for entry, outcome in zip(entries, results):
+                values = {'attempts': entry.attempts + 1}
+                if not isinstance(outcome, Exception):
+                    values.update(status=SheetsOutbox.SENT, sent_at=now, last_error=None)
+                else:
+                    values['last_error'] = str(outcome)
+                    if values['attempts'] >= self.max_attempts:
+                        values['status'] = SheetsOutbox.DEAD
+                        logger.error(
+                            f"Заявка #{entry.request_id} не выгружена в Google Sheets "
+                            f"после {values['attempts']} попыток"
+                        )
+                    else:
+                        values['next_attempt_at'] = now + self.retry_delay(values['attempts'])
+                await session.execute(
+                    update(SheetsOutbox).where(SheetsOutbox.id == entry.id).values(**values)
+                )
+            await session.commit()
+
+
+sheets_outbox = SheetsOutboxWorker(async_session_maker, sheets_writer)
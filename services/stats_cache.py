@@ -0,0 +1,33 @@
+import time
+from typing import Any
+
+from config.settings import settings
+
+
+class TTLCache:
+    """Кэш значения с ограниченным временем жизни"""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._value: Any = None
+        self._expires_at = 0.0
+
+    def get(self) -> Any:
+        """Значение из кэша или None, если оно устарело"""
+        if time.monotonic() >= self._expires_at:
+            return None
+        return self._value
+
+    def set(self, value: Any):
+        self._value = value
+        self._expires_at = time.monotonic() + self.ttl
+
+    def invalidate(self):
+        self._value = None
+        self._expires_at = 0.0
+
+
+# Готовый текст /stats, сбрасывается при появлении и удалении заявок.
+# При нескольких рабочих процессах сброс доходит только до своего процесса,
+# а /stats (апдейты админа) обрабатывает shard-0 - там действует только TTL
+stats_cache = TTLCache(settings.STATS_CACHE_TTL)
@@ -0,0 +1,55 @@
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config.settings import settings
+from database.models import Request
+
+
+def submission_key(data: Dict[str, Any], user_id: int, update_id: int) -> str:
+    """Ключ отправки опроса
+
+    survey_id выдаётся при старте опроса, поэтому и повторная доставка
+    апдейта, и двойное нажатие дают один ключ. Для опросов, начатых до
+    появления survey_id, ключ строится по апдейту.
+    """
+    survey_id = data.get('survey_id')
+    if survey_id:
+        return survey_id
+    return f"{user_id}:{update_id}"
+
+
+class RecentSubmissions:
+    """Недавние ключи отправки и последние заявки пользователей (в памяти, не более max_size)
+
+    Последняя заявка пользователя нужна для повторов, пришедших уже после
+    сброса данных опроса, когда ключ отправки восстановить нельзя.
+    """
+
+    def __init__(self, max_size: int = settings.SUBMISSION_CACHE_SIZE):
+        self.max_size = max_size
+        self._keys: OrderedDict[str, int] = OrderedDict()
+        self._users: OrderedDict[int, int] = OrderedDict()
+
+    def get(self, key: str) -> Optional[int]:
+        return self._keys.get(key)
+
+    def last_for_user(self, user_id: int) -> Optional[int]:
+        return self._users.get(user_id)
+
+    def add(self, key: str, request_id: int, user_id: int):
+        for table, item in ((self._keys, key), (self._users, user_id)):
+            table[item] = request_id
+            table.move_to_end(item)
+            while len(table) > self.max_size:
+                table.popitem(last=False)
+
+
+async def find_submission(session: AsyncSession, key: str) -> Optional[int]:
+    """id заявки с этим ключом отправки (из БД)"""
+    result = await session.execute(select(Request.id).where(Request.submission_key == key))
+    return result.scalar()
+
+
+recent_submissions = RecentSubmissions()
@@ -0,0 +1,161 @@
+import json
+import logging
+import random
+import time
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Идентификатор апдейта для логов и текущая трассировка (если апдейт попал в выборку)
+correlation_id: ContextVar[str] = ContextVar('correlation_id', default='-')
+_trace: ContextVar[Optional['Trace']] = ContextVar('trace', default=None)
+_parent: ContextVar[int] = ContextVar('span_parent', default=0)
+
+
+class Trace:
+    """Спаны одного апдейта: (id, родитель, имя, начало, длительность)"""
+
+    __slots__ = ('cid', 'name', 'started', 'spans', 'last_id', 'closed')
+
+    def __init__(self, cid: str, name: str):
+        self.cid = cid
+        self.name = name
+        self.started = time.perf_counter()
+        self.spans: List[tuple] = []
+        self.last_id = 0
+        self.closed = False
+
+    def new_id(self) -> int:
+        self.last_id += 1
+        return self.last_id
+
+    def add(self, span_id: int, parent: int, name: str, started: float, duration: float):
+        # Спаны фоновых задач, закончившиеся после апдейта, не сохраняются
+        if not self.closed:
+            self.spans.append((span_id, parent, name, started, duration))
+
+    def to_dict(self, duration: float) -> Dict[str, Any]:
+        return {
+            'cid': self.cid,
+            'name': self.name,
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'duration_ms': round(duration * 1000, 2),
+            'spans': [
+                {
+                    'id': span_id,
+                    'parent': parent,
+                    'name': name,
+                    'start_ms': round((started - self.started) * 1000, 2),
+                    'duration_ms': round(span_duration * 1000, 2),
+                }
+                for span_id, parent, name, started, span_duration in self.spans
+            ],
+        }
+
+
+class span:
+    """Вложенный спан: with span('name'): ... (без трассировки ничего не делает)"""
+
+    __slots__ = ('name', 'trace', 'started', 'token', 'span_id')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.trace = _trace.get()
+
+    def __enter__(self):
+        if self.trace is not None:
+            self.started = time.perf_counter()
+            self.span_id = self.trace.new_id()
+            self.token = _parent.set(self.span_id)
+        return self
+
+    def __exit__(self, *exc):
+        if self.trace is not None:
+            _parent.reset(self.token)
+            self.trace.add(self.span_id, _parent.get(), self.name, self.started, time.perf_counter() - self.started)
+        return False
+
+
+def record(name: str, started: float, duration: float):
+    """Уже завершённый спан (для мест, где удобнее замерить время самому)"""
+    trace = _trace.get()
+    if trace is not None:
+        trace.add(trace.new_id(), _parent.get(), name, started, duration)
+
+
+class Tracer:
+    """Трассировка апдейтов по выборке
+
+    Каждому апдейту назначается correlation id (попадает в логи). Доля
+    sample_rate апдейтов трассируется целиком, и если апдейт длился
+    дольше slow_ms, его спаны пишутся в лог и (если задан export_file)
+    строкой JSON в файл.
+    """
+
+    def __init__(
+        self,
+        sample_rate: float = settings.TRACE_SAMPLE_RATE,
+        slow_ms: float = settings.TRACE_SLOW_MS,
+        export_file: str = settings.TRACE_EXPORT_FILE
+    ):
+        self.sample_rate = sample_rate
+        self.slow = slow_ms / 1000
+        self.export_file = export_file
+        self.stats = {
+            'traced': 0,
+            'slow': 0,
+        }
+
+    def start(self, cid: str, name: str) -> tuple:
+        cid_token = correlation_id.set(cid)
+        trace = None
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            trace = Trace(cid, name)
+        return cid_token, _trace.set(trace), trace
+
+    def finish(self, state: tuple):
+        cid_token, trace_token, trace = state
+        try:
+            if trace is not None:
+                self._complete(trace)
+        finally:
+            _trace.reset(trace_token)
+            correlation_id.reset(cid_token)
+
+    def _complete(self, trace: Trace):
+        duration = time.perf_counter() - trace.started
+        trace.closed = True
+        self.stats['traced'] += 1
+        if duration < self.slow:
+            return
+
+        self.stats['slow'] += 1
+        line = json.dumps(trace.to_dict(duration), ensure_ascii=False)
+        logger.warning(f"Медленный апдейт: {line}")
+        if self.export_file:
+            try:
+                with open(self.export_file, 'a', encoding='utf-8') as f:
+                    f.write(line + '\n')
+            except OSError as e:
+                logger.error(f"Ошибка записи трассировки: {e}")
+
+
+class CorrelationIdFilter(logging.Filter):
+    """Добавляет correlation_id апдейта в записи логов"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.correlation_id = correlation_id.get()
+        return True
+
+
+def install_log_filter():
+    """Подключение CorrelationIdFilter ко всем обработчикам корневого логгера"""
+    for handler in logging.getLogger().handlers:
+        handler.addFilter(CorrelationIdFilter())
+
+
+tracer = Tracer()
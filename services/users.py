@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+from aiogram.types import User as TelegramUser
+from sqlalchemy import update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from config.settings import settings
+from database.database import async_session_maker
+from database.models import User
+
+logger = logging.getLogger(__name__)
+
+# Размер одного INSERT при сбросе
+FLUSH_CHUNK_SIZE = 500
+
+
+def upsert_users(dialect: str, rows: list[dict]):
+    """INSERT ... ON CONFLICT DO UPDATE для таблицы users"""
+    insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+    stmt = insert(User).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=[User.id],
+        set_={
+            'username': stmt.excluded.username,
+            'language': stmt.excluded.language,
+            'last_seen': stmt.excluded.last_seen,
+            # Пользователь снова пишет боту - значит, разблокировал его
+            'is_blocked': False,
+        }
+    )
+
+
+async def mark_blocked(session: AsyncSession, user_ids: list[int]):
+    """Отметка пользователей, заблокировавших бота (без commit)"""
+    if user_ids:
+        await session.execute(
+            update(User).where(User.id.in_(user_ids)).values(is_blocked=True)
+        )
+
+
+class UserTracker:
+    """Отложенный учёт пользователей
+
+    touch() только кладёт пользователя в буфер (и пропускает тех, кого
+    видели меньше touch_interval секунд назад), а фоновая задача раз
+    в flush_interval секунд записывает буфер пакетным upsert.
+    """
+
+    def __init__(
+        self,
+        session_maker: async_sessionmaker,
+        flush_interval: float = settings.USER_FLUSH_INTERVAL,
+        touch_interval: float = settings.USER_TOUCH_INTERVAL,
+        cache_size: int = settings.USER_CACHE_SIZE
+    ):
+        self.session_maker = session_maker
+        self.flush_interval = flush_interval
+        self.touch_interval = touch_interval
+        self.cache_size = cache_size
+        self._pending: dict[int, dict] = {}
+        self._touched: OrderedDict[int, float] = OrderedDict()
+        self._task: asyncio.Task | None = None
+
+    def touch(self, user: TelegramUser):
+        """Учёт обращения пользователя"""
+        now = time.monotonic()
+        last = self._touched.get(user.id)
+        if last is not None and now - last < self.touch_interval:
+            return
+
+        self._touched[user.id] = now
+        self._touched.move_to_end(user.id)
+        if len(self._touched) > self.cache_size:
+            self._touched.popitem(last=False)
+
+        seen = datetime.now()
+        pending = self._pending.get(user.id)
+        self._pending[user.id] = {
+            'id': user.id,
+            'username': user.username,
+            'language': user.language_code,
+            # Для новых пользователей - время обращения, а не записи буфера
+            # (у существующих upsert first_seen не трогает)
+            'first_seen': pending['first_seen'] if pending else seen,
+            'last_seen': seen,
+        }
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name='user-tracker')
+
+    async def stop(self):
+        """Остановка с записью буфера"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка записи пользователей: {e}")
+
+    async def flush(self):
+        """Запись буфера в БД"""
+        if not self._pending:
+            return
+
+        rows = list(self._pending.values())
+        self._pending = {}
+
+        try:
+            async with self.session_maker() as session:
+                dialect = session.bind.dialect.name
+                for i in range(0, len(rows), FLUSH_CHUNK_SIZE):
+                    await session.execute(upsert_users(dialect, rows[i:i + FLUSH_CHUNK_SIZE]))
+                await session.commit()
+        except Exception:
+            # Вернуть строки в буфер, более свежие данные не затираем
+            for row in rows:
+                newer = self._pending.setdefault(row['id'], row)
+                newer['first_seen'] = min(newer['first_seen'], row['first_seen'])
+            raise
+
+
+user_tracker = UserTracker(async_session_maker)
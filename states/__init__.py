@@ -1,2 +1,2 @@
-from .tour_states import TourForm
-__all__ = ['TourForm']
+from .survey import SurveyStates
+__all__ = ['SurveyStates']
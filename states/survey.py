@@ -1,4 +1,11 @@
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
 from aiogram.fsm.state import State, StatesGroup
+from aiogram.types import InlineKeyboardMarkup
+
+from config.settings import settings
+from keyboards.inline import back_kb, skip_kb, progress_bar
 
 class SurveyStates(StatesGroup):
     """Состояния опроса пользователя"""
@@ -9,3 +16,118 @@ class SurveyStates(StatesGroup):
     children = State()
     budget = State()
     comment = State()
+
+
+class SurveyError(ValueError):
+    """Некорректный ответ (args[0] - ключ локали с текстом ошибки)"""
+
+
+def parse_text(text: str) -> str:
+    if not text:
+        raise ValueError(text)
+    return text
+
+
+def parse_date(text: str) -> str:
+    try:
+        date_obj = datetime.strptime(text, '%d.%m.%Y')
+    except ValueError:
+        raise SurveyError('date_invalid')
+
+    if date_obj < datetime.now():
+        raise SurveyError('date_past')
+    return text
+
+
+def int_in_range(low: int, high: int) -> Callable[[str], int]:
+    def parse(text: str) -> int:
+        value = int(text)
+        if not (low <= value <= high):
+            raise ValueError(value)
+        return value
+    return parse
+
+
+def parse_budget(text: str) -> int:
+    budget = int(text.replace(' ', '').replace('₽', ''))
+    if budget < settings.MIN_BUDGET:
+        raise ValueError(budget)
+    return budget
+
+
+@dataclass(frozen=True)
+class SurveyStep:
+    """Описание шага опроса
+
+    field - ключ ответа в данных FSM, parse - разбор и проверка ответа
+    (ValueError -> error_key, SurveyError - свой ключ), prompt_key
+    и prompt_fields - текст вопроса этого шага и подстановки в него
+    из данных FSM.
+    """
+    state: State
+    field: str
+    parse: Callable[[str], Any]
+    error_key: str
+    prompt_key: str
+    prompt_fields: Dict[str, str] = field(default_factory=dict)
+    keyboard: Callable[[Any], InlineKeyboardMarkup] = back_kb
+
+
+# Подстановки, общие для всех текстов опроса
+PROMPT_CONSTANTS = {'min_budget': settings.MIN_BUDGET}
+
+SURVEY_STEPS = (
+    SurveyStep(SurveyStates.destination, 'destination', parse_text,
+               'start_survey', 'start_survey'),
+    SurveyStep(SurveyStates.departure_date, 'departure_date', parse_date,
+               'date_invalid', 'destination_saved', {'destination': 'destination'}),
+    SurveyStep(SurveyStates.nights, 'nights', int_in_range(3, 21),
+               'nights_invalid', 'date_saved', {'date': 'departure_date'}),
+    SurveyStep(SurveyStates.adults, 'adults', int_in_range(settings.MIN_TRAVELERS, settings.MAX_TRAVELERS),
+               'adults_invalid', 'nights_saved', {'nights': 'nights'}),
+    SurveyStep(SurveyStates.children, 'children', int_in_range(0, 10),
+               'children_invalid', 'adults_saved', {'adults': 'adults'}),
+    SurveyStep(SurveyStates.budget, 'budget', parse_budget,
+               'budget_invalid', 'children_saved', {'children': 'children'}),
+    SurveyStep(SurveyStates.comment, 'comment', parse_text,
+               'budget_saved', 'budget_saved', {'budget': 'budget'}, keyboard=skip_kb),
+)
+
+
+class SurveyFlow:
+    """Таблица переходов опроса, собирается один раз при импорте"""
+
+    def __init__(self, steps: tuple[SurveyStep, ...]):
+        self.steps = steps
+        self.first = steps[0]
+        self.last = steps[-1]
+        self.states = tuple(step.state for step in steps)
+
+        self.by_state: Dict[str, SurveyStep] = {}
+        self.next: Dict[str, Optional[SurveyStep]] = {}
+        self.prev: Dict[str, Optional[SurveyStep]] = {}
+        self._bars: Dict[str, str] = {}
+
+        for idx, step in enumerate(steps):
+            key = step.state.state
+            self.by_state[key] = step
+            self.next[key] = steps[idx + 1] if idx + 1 < len(steps) else None
+            self.prev[key] = steps[idx - 1] if idx > 0 else None
+            self._bars[key] = progress_bar(idx + 1, len(steps))
+
+    def render(self, step: SurveyStep, t, data: Dict[str, Any]) -> str:
+        """Текст вопроса шага с прогресс-баром"""
+        kwargs = {name: data.get(data_field, '') for name, data_field in step.prompt_fields.items()}
+        return f"{self._bars[step.state.state]}\n\n{t(step.prompt_key, **kwargs, **PROMPT_CONSTANTS)}"
+
+    def parse(self, step: SurveyStep, text: Optional[str]) -> Any:
+        """Разбор ответа, при ошибке - SurveyError с ключом локали"""
+        try:
+            return step.parse((text or '').strip())
+        except SurveyError:
+            raise
+        except ValueError:
+            raise SurveyError(step.error_key)
+
+
+SURVEY = SurveyFlow(SURVEY_STEPS)
@@ -0,0 +1,31 @@
+from typing import Any, Dict
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StateType
+
+from services.metrics import fsm_transitions_total
+
+
+async def advance(state: FSMContext, next_state: StateType = None, replace: bool = False, **data: Any) -> Dict[str, Any]:
+    """Переход к следующему шагу опроса
+
+    Объединяет data с данными FSM (или заменяет их при replace=True),
+    устанавливает next_state и возвращает итоговые данные. Если хранилище
+    умеет transition(), это одна операция вместо update_data + set_state.
+    """
+    fsm_transitions_total.inc(getattr(next_state, 'state', next_state) or 'none')
+    transition = getattr(state.storage, 'transition', None)
+    if transition is not None:
+        return await transition(state.key, next_state, data, replace=replace)
+
+    if replace:
+        await state.set_data(data)
+        merged = dict(data)
+    else:
+        merged = await state.update_data(**data)
+    await state.set_state(next_state)
+    return merged
+
+
+async def finish(state: FSMContext) -> None:
+    """Сброс состояния и данных одной операцией (аналог state.clear())"""
+    await advance(state, None, replace=True)
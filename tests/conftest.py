@@ -0,0 +1,52 @@
+import asyncio
+import os
+import tempfile
+
+import pytest
+from aiogram.fsm.storage.memory import MemoryStorage
+
+# Настройки читаются при импорте config.settings, поэтому задаются до импорта бота
+TEST_DIR = tempfile.mkdtemp(prefix='tourbot-tests-')
+os.environ.update({
+    'TELEGRAM_TOKEN': '42:TEST',
+    'DATABASE_URL': f'sqlite+aiosqlite:///{TEST_DIR}/bot.db',
+    'ADMIN_CHAT_ID': '1000',
+    'WEBHOOK_SECRET': 'test-secret',
+    'FSM_STORAGE': 'memory',
+    'METRICS_ENABLED': 'false',
+    'TRACE_SAMPLE_RATE': '0',
+    'THROTTLE_BURST': '1000',
+})
+
+from database.database import engine, init_db  # noqa: E402
+from database.models import Base  # noqa: E402
+from main import build_dispatcher  # noqa: E402
+
+
+@pytest.fixture
+def run():
+    """Запуск корутины в новом цикле событий с закрытием соединений БД после неё"""
+    def runner(coro):
+        async def main():
+            try:
+                return await coro
+            finally:
+                await engine.dispose()
+        return asyncio.run(main())
+    return runner
+
+
+@pytest.fixture
+def db(run):
+    """Пустая БД с актуальной схемой"""
+    async def reset():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+        await init_db()
+    run(reset())
+
+
+@pytest.fixture(scope='session')
+def dp():
+    """Диспетчер бота (роутеры модулей подключаются к диспетчеру только один раз)"""
+    return build_dispatcher(MemoryStorage())
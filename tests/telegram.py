@@ -0,0 +1,93 @@
+import asyncio
+import itertools
+import time
+from datetime import datetime
+from typing import Any, Dict, List
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import EditMessageText, SendMessage, TelegramMethod
+from aiogram.types import Chat, Message
+
+BOT_ID = 42
+
+_ids = itertools.count(1)
+
+
+class FakeSession(BaseSession):
+    """Сессия бота без сети: запоминает вызовы API и отвечает правдоподобными объектами"""
+
+    def __init__(self, delay: float = 0):
+        super().__init__()
+        # Задержка ответа, как у настоящего API
+        self.delay = delay
+        self.calls: List[TelegramMethod] = []
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: int | None = None) -> Any:
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.calls.append(method)
+        if method.__returning__ is Message:
+            return Message(
+                message_id=next(_ids),
+                date=datetime.now(),
+                chat=Chat(id=int(method.chat_id), type='private'),
+                text=getattr(method, 'text', None)
+            )
+        return True
+
+    async def stream_content(self, *args, **kwargs):
+        raise NotImplementedError
+        yield b''
+
+    async def close(self):
+        pass
+
+    def texts(self, chat_id: int) -> List[str]:
+        """Тексты отправленных и отредактированных сообщений в чате"""
+        return [
+            call.text for call in self.calls
+            if isinstance(call, (SendMessage, EditMessageText)) and int(call.chat_id) == chat_id
+        ]
+
+
+def create_bot(delay: float = 0) -> Bot:
+    return Bot(token=f'{BOT_ID}:TEST', session=FakeSession(delay))
+
+
+def _user(user_id: int) -> Dict[str, Any]:
+    return {'id': user_id, 'is_bot': False, 'first_name': 'Test', 'username': f'user{user_id}'}
+
+
+def message_update(user_id: int, text: str) -> Dict[str, Any]:
+    """Апдейт с сообщением пользователя (в виде JSON от Telegram)"""
+    return {
+        'update_id': next(_ids),
+        'message': {
+            'message_id': next(_ids),
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': _user(user_id),
+            'text': text,
+        },
+    }
+
+
+def callback_update(user_id: int, data: str) -> Dict[str, Any]:
+    """Апдейт с нажатием inline-кнопки под сообщением бота"""
+    return {
+        'update_id': next(_ids),
+        'callback_query': {
+            'id': str(next(_ids)),
+            'from': _user(user_id),
+            'chat_instance': str(user_id),
+            'data': data,
+            'message': {
+                'message_id': next(_ids),
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private'},
+                'from': {'id': BOT_ID, 'is_bot': True, 'first_name': 'Bot'},
+                'text': '...',
+            },
+        },
+    }
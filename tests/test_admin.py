@@ -0,0 +1,53 @@
+from sqlalchemy import select
+
+from config.settings import settings
+from database.database import async_session_maker
+from database.models import Request
+from tests.telegram import create_bot, message_update
+
+USER_ID = 12345
+NO_ACCESS = '🔒 У вас нет доступа к админ-панели'
+
+
+async def add_request() -> int:
+    async with async_session_maker() as session:
+        request = Request(
+            user_id=USER_ID, destination='Турция', departure_date='01.01.2030',
+            nights=7, adults=2, children=0, budget=100000
+        )
+        session.add(request)
+        await session.commit()
+        return request.id
+
+
+def test_admin_commands_ignore_other_users(dp, db, run):
+    async def scenario():
+        request_id = await add_request()
+        bot = create_bot()
+        for text in ('/admin', '/stats', f'/delete {request_id}', '/bc_status', '/broadcast'):
+            await dp.feed_raw_update(bot, message_update(USER_ID, text))
+        async with async_session_maker() as session:
+            kept = await session.get(Request, request_id)
+        return bot.session.texts(USER_ID), kept
+
+    texts, kept = run(scenario())
+
+    # /admin и /stats получают отказ, остальные команды игнорируются
+    assert texts == [NO_ACCESS, NO_ACCESS]
+    assert kept is not None
+
+
+def test_admin_commands_work_for_admin(dp, db, run):
+    async def scenario():
+        request_id = await add_request()
+        bot = create_bot()
+        await dp.feed_raw_update(bot, message_update(settings.ADMIN_CHAT_ID, '/stats'))
+        await dp.feed_raw_update(bot, message_update(settings.ADMIN_CHAT_ID, f'/delete {request_id}'))
+        async with async_session_maker() as session:
+            remaining = (await session.execute(select(Request))).scalars().all()
+        return bot.session.texts(settings.ADMIN_CHAT_ID), remaining
+
+    texts, remaining = run(scenario())
+
+    assert len(texts) == 2
+    assert remaining == []
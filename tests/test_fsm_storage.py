@@ -0,0 +1,40 @@
+import asyncio
+
+from aiogram.fsm.storage.base import StorageKey
+
+from database.database import async_session_maker
+from database.fsm_storage import DatabaseStorage
+from services import tracing
+
+KEY = StorageKey(bot_id=42, chat_id=12345, user_id=12345)
+
+
+class RecordingStorage(DatabaseStorage):
+    """Запоминает контекст, в котором работает фоновый сброс"""
+
+    flushed_in = None
+
+    async def flush(self):
+        if self._dirty and self.flushed_in is None:
+            self.flushed_in = (tracing.correlation_id.get(), tracing._trace.get())
+        await super().flush()
+
+
+def test_flush_task_does_not_keep_update_context(db, run):
+    async def scenario():
+        storage = RecordingStorage(async_session_maker, flush_interval=0.01)
+        # Как TracingMiddleware для апдейта, попавшего в выборку
+        update_tracer = tracing.Tracer(sample_rate=1)
+        state = update_tracer.start('u1', 'message')
+        await storage.set_state(KEY, 'SurveyStates:destination')
+        update_tracer.finish(state)
+
+        await asyncio.sleep(0.05)
+        await storage.close()
+        reloaded = DatabaseStorage(async_session_maker)
+        return storage.flushed_in, await reloaded.get_state(KEY)
+
+    flushed_in, saved_state = run(scenario())
+
+    assert flushed_in == ('-', None)
+    assert saved_state == 'SurveyStates:destination'
@@ -0,0 +1,97 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import database.database
+from database.database import init_db
+from database.migrations import MIGRATIONS
+from tests.conftest import TEST_DIR
+
+# Таблица requests до индексов и миграций
+BASELINE_SCHEMA = """
+CREATE TABLE requests (
+    id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    username VARCHAR(100),
+    destination VARCHAR(200) NOT NULL,
+    departure_date VARCHAR(20) NOT NULL,
+    nights INTEGER NOT NULL,
+    adults INTEGER NOT NULL,
+    children INTEGER NOT NULL,
+    budget INTEGER NOT NULL,
+    comment TEXT,
+    created_at DATETIME
+)
+"""
+
+# Запрос -> индекс, который он должен использовать после миграций
+QUERIES = {
+    # /today, /stats за период, постраничный экспорт
+    "SELECT id FROM requests WHERE created_at >= '2030-01-01' ORDER BY created_at, id": 'ix_requests_created_at_id',
+    # Заявки пользователя
+    "SELECT id FROM requests WHERE user_id = 12345": 'ix_requests_user_id',
+    # ТОП направлений
+    "SELECT destination, COUNT(*) FROM requests GROUP BY destination": 'ix_requests_destination',
+}
+
+
+async def create_baseline(path: str):
+    engine = create_async_engine(f'sqlite+aiosqlite:///{path}')
+    async with engine.begin() as conn:
+        await conn.execute(text(BASELINE_SCHEMA))
+        await conn.execute(text(
+            "INSERT INTO requests (user_id, username, destination, departure_date, nights, adults, children, budget, created_at) "
+            "VALUES (12345, 'user', 'Турция', '01.01.2030', 7, 2, 0, 100000, '2026-01-01 10:00:00')"
+        ))
+    return engine
+
+
+async def query_plans(engine) -> dict:
+    plans = {}
+    async with engine.connect() as conn:
+        for query in QUERIES:
+            rows = (await conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {query}')).all()
+            plans[query] = ' | '.join(row[-1] for row in rows)
+    return plans
+
+
+def test_indexes_used_after_migrations(monkeypatch, run):
+    async def scenario():
+        engine = await create_baseline(f'{TEST_DIR}/explain.db')
+        before = await query_plans(engine)
+        monkeypatch.setattr(database.database, 'engine', engine)
+        await init_db()
+        after = await query_plans(engine)
+        await engine.dispose()
+        return before, after
+
+    before, after = run(scenario())
+
+    for query, index in QUERIES.items():
+        assert before[query].startswith('SCAN requests') and index not in before[query]
+        assert f'INDEX {index}' in after[query], after[query]
+
+
+def test_init_db_upgrades_baseline_database(monkeypatch, run):
+    async def scenario():
+        engine = await create_baseline(f'{TEST_DIR}/upgrade.db')
+        monkeypatch.setattr(database.database, 'engine', engine)
+        await init_db()
+        # Повторный запуск (перезапуск бота) ничего не меняет
+        await init_db()
+        async with engine.connect() as conn:
+            versions = (await conn.execute(text("SELECT version FROM schema_migrations"))).scalars().all()
+            columns, indexes = await conn.run_sync(lambda sync_conn: (
+                [column['name'] for column in inspect(sync_conn).get_columns('requests')],
+                [index['name'] for index in inspect(sync_conn).get_indexes('requests')],
+            ))
+            users = (await conn.execute(text("SELECT id, username FROM users"))).all()
+        await engine.dispose()
+        return versions, columns, indexes, users
+
+    versions, columns, indexes, users = run(scenario())
+
+    assert sorted(versions) == [version for version, _, _ in MIGRATIONS]
+    assert 'submission_key' in columns
+    assert 'ux_requests_submission_key' in indexes
+    # Пользователи перенесены из существующих заявок
+    assert users == [(12345, 'user')]
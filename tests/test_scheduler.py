@@ -0,0 +1,51 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from aiogram.fsm.storage.base import StorageKey
+
+from database.database import async_session_maker
+from database.fsm_storage import DatabaseStorage, _key
+from states.survey import SurveyStates
+from tests.telegram import BOT_ID, create_bot, message_update
+
+USER_ID = 12345
+KEY = StorageKey(bot_id=BOT_ID, chat_id=USER_ID, user_id=USER_ID)
+DEPARTURE = (datetime.now() + timedelta(days=90)).strftime('%d.%m.%Y')
+
+
+class SlowLoadStorage(DatabaseStorage):
+    """Первое чтение ключа из БД медленнее второго (как под нагрузкой)"""
+
+    def __init__(self, *args, delays, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.delays = list(delays)
+
+    async def _entry(self, key: StorageKey):
+        if _key(key) not in self._cache and self.delays:
+            await asyncio.sleep(self.delays.pop(0))
+        return await super()._entry(key)
+
+
+def test_updates_keep_order_on_slow_state_load(dp, db, run, monkeypatch):
+    async def scenario():
+        # Пользователь посреди опроса, состояние только в БД (кэш пуст)
+        saved = DatabaseStorage(async_session_maker)
+        await saved.set_state(KEY, SurveyStates.destination)
+        await saved.close()
+
+        storage = SlowLoadStorage(async_session_maker, delays=[0.05, 0])
+        monkeypatch.setattr(dp.fsm, 'storage', storage)
+        bot = create_bot()
+        # Два быстрых сообщения: направление, затем дата
+        await asyncio.gather(
+            dp.feed_raw_update(bot, message_update(USER_ID, 'Турция')),
+            dp.feed_raw_update(bot, message_update(USER_ID, DEPARTURE)),
+        )
+        result = await storage.get_state(KEY), await storage.get_data(KEY)
+        await storage.close()
+        return result
+
+    state, data = run(scenario())
+
+    assert data == {'destination': 'Турция', 'departure_date': DEPARTURE}
+    assert state == SurveyStates.nights.state
@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+from aiogram.types import User
+
+from middlewares.throttling import (
+    MemoryRateLimitStorage, RateLimitStorage, RedisRateLimitStorage, ThrottlingMiddleware
+)
+from services.metrics import throttle_errors_total
+
+fakeredis = pytest.importorskip('fakeredis', reason='нужен fakeredis[lua]')
+pytest.importorskip('lupa', reason='нужен fakeredis[lua]')
+
+USER_ID = 12345
+
+
+def redis_storage(server=None) -> RedisRateLimitStorage:
+    """Хранилище на fakeredis (Lua-скрипты выполняет lupa)"""
+    client = fakeredis.FakeAsyncRedis(server=server or fakeredis.FakeServer())
+    return RedisRateLimitStorage(ttl=60, client=client)
+
+
+STORAGES = {
+    'memory': lambda: MemoryRateLimitStorage(ttl=60),
+    'redis': redis_storage,
+}
+
+
+@pytest.mark.parametrize('backend', STORAGES)
+def test_burst_then_wait(backend):
+    async def scenario():
+        storage = STORAGES[backend]()
+        waits = [await storage.hit(USER_ID, 10, 3) for _ in range(4)]
+        other = await storage.hit(USER_ID + 1, 10, 3)
+        await storage.close()
+        return waits, other
+
+    waits, other = asyncio.run(scenario())
+
+    assert waits[:3] == [0, 0, 0]
+    # Следующий токен появится через rate_period
+    assert 9 < waits[3] <= 10
+    # У другого пользователя своя корзина
+    assert other == 0
+
+
+@pytest.mark.parametrize('backend', STORAGES)
+def test_tokens_refill(backend):
+    async def scenario():
+        storage = STORAGES[backend]()
+        first = await storage.hit(USER_ID, 0.05, 1)
+        throttled = await storage.hit(USER_ID, 0.05, 1)
+        await asyncio.sleep(0.06)
+        refilled = await storage.hit(USER_ID, 0.05, 1)
+        await storage.close()
+        return first, throttled, refilled
+
+    first, throttled, refilled = asyncio.run(scenario())
+
+    assert first == 0
+    assert throttled > 0
+    assert refilled == 0
+
+
+def test_redis_state_shared_between_replicas():
+    async def scenario():
+        server = fakeredis.FakeServer()
+        replicas = [redis_storage(server), redis_storage(server)]
+        waits = [await replicas[i % 2].hit(USER_ID, 10, 2) for i in range(3)]
+        ttl = await replicas[0].redis.pttl(f'throttle:{USER_ID}')
+        for storage in replicas:
+            await storage.close()
+        return waits, ttl
+
+    waits, ttl = asyncio.run(scenario())
+
+    assert waits[:2] == [0, 0]
+    assert waits[2] > 0
+    # Ключ истекает сам
+    assert 0 < ttl <= 60000
+
+
+class BrokenStorage(RateLimitStorage):
+    async def hit(self, user_id: int, rate_period: float, burst: int) -> float:
+        raise ConnectionError('redis is down')
+
+
+def test_middleware_fails_open(caplog):
+    async def handler(event, data):
+        return 'handled'
+
+    async def scenario():
+        middleware = ThrottlingMiddleware(BrokenStorage(), rate_period=10, burst=1)
+        user = User(id=USER_ID, is_bot=False, first_name='Test')
+        return [await middleware(handler, None, {'event_from_user': user}) for _ in range(3)], middleware
+
+    errors_before = throttle_errors_total.values.get((), 0)
+    results, middleware = asyncio.run(scenario())
+
+    assert results == ['handled'] * 3
+    assert middleware.stats['errors'] == 3
+    assert throttle_errors_total.values[()] - errors_before == 3
+    # В лог - один раз, а не на каждый апдейт
+    assert len([record for record in caplog.records if record.levelname == 'ERROR']) == 1
@@ -0,0 +1,35 @@
+import asyncio
+
+from aiogram.types import User as TelegramUser
+
+from database.database import async_session_maker
+from database.models import User
+from services.users import UserTracker
+
+USER_ID = 12345
+
+
+def test_first_seen_is_touch_time(db, run):
+    async def scenario():
+        tracker = UserTracker(async_session_maker, touch_interval=0)
+        user = TelegramUser(id=USER_ID, is_bot=False, first_name='Test', username='first')
+        tracker.touch(user)
+        # Буфер пишется позже обращения
+        await asyncio.sleep(0.05)
+        await tracker.flush()
+        async with async_session_maker() as session:
+            first = await session.get(User, USER_ID)
+
+        tracker.touch(user.model_copy(update={'username': 'second'}))
+        await tracker.flush()
+        async with async_session_maker() as session:
+            second = await session.get(User, USER_ID)
+        return first, second
+
+    first, second = run(scenario())
+
+    assert first.first_seen == first.last_seen
+    # Повторное обращение обновляет только last_seen и профиль
+    assert second.first_seen == first.first_seen
+    assert second.last_seen > first.last_seen
+    assert second.username == 'second'
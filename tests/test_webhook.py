@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta
+
+from aiohttp.test_utils import TestClient, TestServer
+from sqlalchemy import func, select
+
+from config.settings import settings
+from database.database import async_session_maker
+from database.models import Request, SheetsOutbox
+from main import build_webhook_app
+from services.background import side_effects
+from tests.telegram import callback_update, create_bot, message_update
+
+USER_ID = 12345
+DEPARTURE = (datetime.now() + timedelta(days=90)).strftime('%d.%m.%Y')
+ANSWERS = ['Турция', DEPARTURE, '7', '2', '1', '150000', 'Море']
+
+
+def secret_header(token: str) -> dict:
+    return {'X-Telegram-Bot-Api-Secret-Token': token}
+
+
+def test_survey_creates_request(dp, db, run):
+    async def scenario():
+        bot = create_bot()
+        updates = [message_update(USER_ID, '/start'), callback_update(USER_ID, 'start_survey')]
+        updates += [message_update(USER_ID, answer) for answer in ANSWERS]
+        for update in updates:
+            await dp.feed_raw_update(bot, update)
+        await side_effects.drain()
+
+        async with async_session_maker() as session:
+            requests = (await session.execute(select(Request))).scalars().all()
+            outbox = await session.scalar(select(func.count()).select_from(SheetsOutbox))
+        return requests, outbox, bot.session
+
+    requests, outbox, telegram = run(scenario())
+
+    assert len(requests) == 1
+    request = requests[0]
+    assert (request.user_id, request.destination, request.departure_date) == (USER_ID, 'Турция', DEPARTURE)
+    assert (request.nights, request.adults, request.children, request.budget) == (7, 2, 1, 150000)
+    assert request.comment == 'Море'
+    assert outbox == 1
+    # Подтверждение пользователю и уведомление админа
+    assert f'#{request.id}' in telegram.texts(USER_ID)[-1]
+    assert f'#{request.id}' in telegram.texts(settings.ADMIN_CHAT_ID)[-1]
+
+
+def test_webhook_checks_secret(dp, run):
+    async def scenario():
+        bot = create_bot()
+        app, handler = build_webhook_app(dp, bot)
+        async with TestClient(TestServer(app)) as client:
+            statuses = []
+            for headers in ({}, secret_header('wrong'), secret_header(settings.WEBHOOK_SECRET)):
+                response = await client.post(settings.WEBHOOK_PATH, json=message_update(USER_ID, '/start'), headers=headers)
+                statuses.append(response.status)
+            await handler.drain()
+        return statuses, bot.session.texts(USER_ID)
+
+    statuses, texts = run(scenario())
+
+    assert statuses == [401, 401, 200]
+    # Обработан только апдейт с правильным секретом
+    assert len(texts) == 1
+
+
+def test_webhook_drains_before_shutdown(dp, run):
+    async def scenario():
+        bot = create_bot(delay=0.2)
+        app, handler = build_webhook_app(dp, bot)
+        async with TestClient(TestServer(app)) as client:
+            headers = secret_header(settings.WEBHOOK_SECRET)
+            accepted = await client.post(settings.WEBHOOK_PATH, json=message_update(USER_ID, '/start'), headers=headers)
+            # Ответ Telegram уже отправлен, апдейт ещё обрабатывается
+            answered_before = len(bot.session.texts(USER_ID))
+            await handler.drain()
+            answered_after = len(bot.session.texts(USER_ID))
+            rejected = await client.post(settings.WEBHOOK_PATH, json=message_update(USER_ID, '/start'), headers=headers)
+        return accepted.status, answered_before, answered_after, rejected.status
+
+    assert run(scenario()) == (200, 0, 1, 503)